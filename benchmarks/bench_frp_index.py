@@ -0,0 +1,90 @@
+"""
+FrpIndex 基准测试：用合成的服务 / FRP 映射规模对比逐条遍历与索引查询
+
+用法: python benchmarks/bench_frp_index.py [服务数] [映射数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frp_index import FrpIndex, LOCAL_HOSTS
+
+def make_fleet(n_services, n_mappings, seed=42):
+    rnd = random.Random(seed)
+    servers = [f"10.0.{i // 250}.{i % 250}" for i in range(64)] + [f"frps{i}.example.com" for i in range(16)]
+    mappings = [{
+        'name': f"proxy-{i}",
+        'local_ip': rnd.choice(['127.0.0.1', '192.168.1.10', '0.0.0.0', '10.0.0.5']),
+        'local_port': str(rnd.randint(1000, 60000)),
+        'remote_port': str(rnd.randint(1000, 60000)),
+        'server_addr': rnd.choice(servers),
+        'source_file': f"frpc{i % 32}.toml"
+    } for i in range(n_mappings)]
+    services = [{
+        'ip': rnd.choice(servers[:64]),
+        'port': str(rnd.randint(1000, 60000)),
+        'backend_port': str(rnd.randint(1000, 60000)),
+        'lucky_ip': rnd.choice(servers[:64])
+    } for _ in range(n_services)]
+    return services, mappings
+
+def resolve_server(addr):
+    return "10.0.0." + str(sum(map(ord, addr)) % 250)
+
+def naive_pre(mappings, ip, port, lucky_ip):
+    # 与原 main.py 中的逐条遍历逻辑一致 (server_addr 每次都重新解析)
+    for fm in mappings:
+        f_server = fm.get('server_addr', '').lower()
+        f_server_ip = f_server if f_server[0].isdigit() else resolve_server(f_server)
+        p_remote, l_port = str(fm.get('remote_port')), str(fm.get('local_port'))
+        l_ip = fm.get('local_ip', '').lower()
+        if f_server_ip.lower() == ip.lower() and (p_remote == port or l_port == port) \
+                and l_ip in list(LOCAL_HOSTS) + [(lucky_ip or "").lower()]:
+            return fm
+    return None
+
+def naive_post(mappings, backend_port, lucky_ip):
+    for fm in mappings:
+        if str(fm.get('remote_port')) == backend_port or str(fm.get('local_port')) == backend_port:
+            f_server = fm.get('server_addr', '').lower()
+            if (lucky_ip and f_server == lucky_ip.lower()) or f_server in LOCAL_HOSTS:
+                return fm
+    return None
+
+def main():
+    n_services = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    n_mappings = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    services, mappings = make_fleet(n_services, n_mappings)
+    # 让一部分服务必定命中
+    for s, fm in zip(services[::7], mappings[::3]):
+        s['port'] = fm['remote_port']
+        s['backend_port'] = fm['local_port']
+
+    started = time.perf_counter()
+    index = FrpIndex(mappings, resolve_server)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = [(index.match_pre_lucky(s['ip'], s['port'], s['lucky_ip']),
+             index.match_post_lucky(s['backend_port'], s['lucky_ip'])) for s in services]
+    indexed = time.perf_counter() - started
+
+    # 逐条遍历是 O(服务 × 映射)，只取样一部分再按比例估算
+    sample = services[:max(1, min(len(services), 200))]
+    started = time.perf_counter()
+    slow = [(naive_pre(mappings, s['ip'], s['port'], s['lucky_ip']),
+             naive_post(mappings, s['backend_port'], s['lucky_ip'])) for s in sample]
+    naive = (time.perf_counter() - started) * len(services) / len(sample)
+
+    assert slow == fast[:len(sample)], "索引结果与逐条遍历不一致"
+    hits = sum(1 for pre, post in fast if pre or post)
+    print(f"服务 {n_services} × 映射 {n_mappings} (命中 {hits})")
+    print(f"  索引构建: {build * 1000:.1f} ms")
+    print(f"  索引查询: {indexed * 1000:.1f} ms ({indexed / len(services) * 1e6:.2f} µs/服务)")
+    print(f"  逐条遍历: {naive * 1000:.0f} ms (按 {len(sample)} 条取样估算)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+ServiceResolver 基准测试：用不同规模的合成数据跑完整的路径溯源，输出每个服务的平均耗时
+
+用法: python benchmarks/bench_resolver.py [规模 ...]   (默认 100 1000 10000)
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resolver import ServiceResolver
+
+def make_fleet(n_services, seed=42):
+    """生成 n_services 个服务，以及同等规模的 FRP 映射、CF 记录和 static_mappings"""
+    rnd = random.Random(seed)
+    n_servers = max(2, n_services // 200)
+    server_ips = {f"lucky-{i}": f"10.{i // 250}.{i % 250}.1" for i in range(n_servers)}
+    zones = [f"zone{i}.example.com" for i in range(max(1, n_services // 100))]
+
+    services, cf_records = [], []
+    for i in range(n_services):
+        zone = rnd.choice(zones)
+        host = f"svc{i}.{zone}"
+        port = rnd.choice(["", ":16666", ":8443"])
+        services.append({
+            "domain": host + port,
+            "protocol": rnd.choice(["http", "https"]),
+            "internal_addr": f"http://127.0.0.1:{rnd.randint(1000, 60000)}",
+            "server_name": rnd.choice(list(server_ips))
+        })
+        if rnd.random() < 0.7:
+            cf_records.append({"name": host, "content": rnd.choice(list(server_ips.values())),
+                               "proxied": rnd.random() < 0.3, "type": "A"})
+    cf_records.extend({"name": f"*.{z}", "content": "1.2.3.4", "proxied": False, "type": "A"} for z in zones)
+
+    frp_mappings = [{
+        "name": f"proxy-{i}",
+        "local_ip": rnd.choice(["127.0.0.1", "192.168.1.10"]),
+        "local_port": str(rnd.randint(1000, 60000)),
+        "remote_port": str(rnd.randint(1000, 60000)),
+        "server_addr": rnd.choice(list(server_ips.values()) + ["127.0.0.1"]),
+        "source_file": f"frpc{i % 16}.toml"
+    } for i in range(n_services)]
+
+    static_mappings = [{
+        "pattern": rf".*\.{z.replace('.', chr(92) + '.')}",
+        "description": "{server_name} ➔ {internal_addr}",
+        "comment": f"group-{j}",
+        "port_map": {"16666": "11466"}
+    } for j, z in enumerate(zones[::2])]
+    return services, frp_mappings, cf_records, server_ips, static_mappings
+
+def run(n_services):
+    services, frp_mappings, cf_records, server_ips, static_mappings = make_fleet(n_services)
+    started = time.perf_counter()
+    resolver = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings,
+                               cf_records=cf_records, verbose=False)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    records = resolver.resolve_all(services)
+    elapsed = time.perf_counter() - started
+    assert len(records) == n_services
+    print(f"{n_services:>7} 个服务 | 构建 {build * 1000:8.1f} ms | 溯源 {elapsed * 1000:9.1f} ms "
+          f"| {elapsed / n_services * 1e6:8.1f} µs/服务 | 静态映射 {len(static_mappings)} 条")
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 1000, 10000]
+    for n in sizes:
+        run(n)
+
+if __name__ == "__main__":
+    main()
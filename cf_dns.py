@@ -1,76 +1,269 @@
+import hashlib
 import requests
 import json
-import socket
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from dns_resolver import get_resolver
+from output_writer import dumps_compact, write_if_changed
+
+API_BASE = "https://api.cloudflare.com/client/v4"
 
 # 全局缓存
 _cf_cache = []
+# 索引：精确域名 ➔ 记录；泛域名按倒序标签组织成后缀 trie (com ➔ example ➔ {"*": 记录})
+_cf_exact = {}
+_cf_wildcards = {}
+# 记录内容每变化一次加一，供下游 (ServiceResolver) 判断是否需要重建
+_cf_version = 0
+WILDCARD_KEY = "*"
+
+def build_cf_index(records):
+    """根据记录列表构建 (精确匹配字典, 泛域名后缀 trie)，同名记录保留第一条"""
+    exact, trie = {}, {}
+    for rec in records:
+        name = rec['name'].rstrip('.')
+        if name == '*' or name.startswith('*.'):
+            node = trie
+            for label in reversed(name[2:].split('.') if name != '*' else []):
+                node = node.setdefault(label, {})
+            node.setdefault(WILDCARD_KEY, rec)
+        elif '*' not in name:
+            exact.setdefault(name, rec)
+    return exact, trie
+
+def set_cf_records(records):
+    """替换内存中的记录并重建索引 (记录未变化时什么也不做)"""
+    global _cf_cache, _cf_exact, _cf_wildcards, _cf_version
+    if records == _cf_cache and _cf_version:
+        return
+    _cf_cache = records
+    _cf_exact, _cf_wildcards = build_cf_index(records)
+    _cf_version += 1
+
+def get_cf_index():
+    """(版本号, 精确匹配字典, 泛域名 trie)，索引由 set_cf_records 维护，调用方直接复用而不必重建"""
+    return _cf_version, _cf_exact, _cf_wildcards
+
+def create_cf_session(api_token, pool_size=4):
+    """带连接池的 Cloudflare API Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json"
+    })
+    return session
+
+def _get_json(session, url, params, max_retries=5):
+    """GET 并解析 JSON；遇到 429 / 5xx 时按 Retry-After 或指数退避重试"""
+    for attempt in range(max_retries + 1):
+        resp = session.get(url, params=params, timeout=15)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            if attempt == max_retries:
+                break
+            retry_after = resp.headers.get("Retry-After")
+            try:
+                delay = float(retry_after) if retry_after else min(2 ** attempt, 30)
+            except ValueError:
+                delay = min(2 ** attempt, 30)
+            print(f"[!] [CF-DNS] HTTP {resp.status_code}，{delay:.0f}s 后重试: {url}")
+            time.sleep(delay)
+            continue
+        data = resp.json()
+        if data.get("success") is False:
+            raise RuntimeError(f"API 返回错误: {data.get('errors')}")
+        return data
+    raise RuntimeError(f"HTTP {resp.status_code}，重试 {max_retries} 次后仍失败")
+
+def fetch_paginated(session, url, params=None, per_page=50, first=None):
+    """按 result_info.total_pages 拉取所有分页；first 为已经取到的第一页响应时从第二页开始"""
+    results = []
+    page = 1
+    data = first
+    while True:
+        if data is None:
+            data = _get_json(session, url, dict(params or {}, page=page, per_page=per_page))
+        results.extend(data.get("result") or [])
+        total_pages = (data.get("result_info") or {}).get("total_pages") or 1
+        if page >= total_pages:
+            return results
+        page += 1
+        data = None
+
+RECORD_TYPES = "A,AAAA"
+RECORD_PAGE_SIZE = 1000
 
-def fetch_all_cf_records(api_token):
+def _zone_marker(records):
     """
-    一次性获取所有 Zone 下的所有 A/AAAA 记录并缓存到内存中
+    Zone 的记录变化标记：记录总数 + 所有记录 (id, modified_on) 的摘要
+    增、删、改任何一条记录都会改变标记；记录列表接口不支持按 modified_on 排序，因此只能由完整的记录列表计算
+    """
+    digest = hashlib.sha1()
+    for rec_id, modified_on in sorted((str(rec.get('id', '')), str(rec.get('modified_on', ''))) for rec in records):
+        digest.update(f"{rec_id}|{modified_on}\n".encode())
+    return [len(records), digest.hexdigest()]
+
+def _records_url(zone, api_base=None):
+    return f"{api_base or API_BASE}/zones/{zone['id']}/dns_records"
+
+def probe_zone(session, zone, api_base=None):
+    """
+    请求记录列表的第一页 (一次请求)，返回 (变化标记, 第一页响应)
+    只有一页时第一页就是完整的记录列表，标记与 fetch_zone_records 的计算方式相同；
+    多页的 Zone 无法由一页判断是否变化，标记为 None，由 fetch_zone_records 接着拉取剩余分页
+    """
+    data = _get_json(session, _records_url(zone, api_base),
+                     {"type": RECORD_TYPES, "page": 1, "per_page": RECORD_PAGE_SIZE})
+    if ((data.get("result_info") or {}).get("total_pages") or 1) > 1:
+        return None, data
+    return _zone_marker(data.get("result") or []), data
+
+def fetch_zone_records(session, zone, api_base=None, first_page=None):
+    """拉取单个 Zone 下的所有 A/AAAA 记录，返回 (记录列表, 变化标记, 耗时)；first_page 为 probe_zone 已取到的第一页"""
+    started = time.perf_counter()
+    records = fetch_paginated(session, _records_url(zone, api_base), {"type": RECORD_TYPES},
+                              per_page=RECORD_PAGE_SIZE, first=first_page)
+    result = [{
+        "name": rec['name'].lower(),
+        "content": rec['content'],
+        "proxied": rec.get('proxied', False),
+        "type": rec['type']
+    } for rec in records]
+    return result, _zone_marker(records), time.perf_counter() - started
+
+def load_cf_snapshot(snapshot_file):
+    """读取本地 DNS 快照: {synced_at, zones: {zone_id: {name, marker, records}}}"""
+    if not snapshot_file or not os.path.exists(snapshot_file):
+        return None
+    try:
+        with open(snapshot_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[!] [CF-DNS] 读取快照失败: {e}")
+        return None
+
+def save_cf_snapshot(snapshot_file, snapshot):
+    if not snapshot_file:
+        return
+    try:
+        write_if_changed(snapshot_file, dumps_compact(snapshot), mode=0o600)
+    except Exception as e:
+        print(f"[!] [CF-DNS] 保存快照失败: {e}")
+
+def _snapshot_records(snapshot):
+    records = []
+    for zone in snapshot.get("zones", {}).values():
+        records.extend(zone.get("records", []))
+    return records
+
+def fetch_all_cf_records(api_token, max_workers=4, api_base=None, snapshot_file=None, snapshot_ttl=0, force=False):
+    """
+    获取所有 Zone 下的所有 A/AAAA 记录并缓存到内存中
+    Zone 与记录均完整分页；各 Zone 在有限线程池中并发拉取
+    指定 snapshot_file 时：快照未超过 snapshot_ttl 秒则直接加载，不访问 API；
+    过期后每个 Zone 先请求第一页，记录总数与 (id, modified_on) 摘要未变化的 Zone 直接复用快照，
+    其余 Zone 接着已取到的第一页拉取剩余分页 (单页 Zone 只需这一次请求)。
+    force=True 时全量同步
     """
-    global _cf_cache
     if not api_token:
         return
         
+    snapshot = None if force else load_cf_snapshot(snapshot_file)
+    if snapshot and time.time() - snapshot.get("synced_at", 0) < snapshot_ttl:
+        set_cf_records(_snapshot_records(snapshot))
+        print(f"[+] [CF-DNS] 使用本地快照 {snapshot_file}，共 {len(_cf_cache)} 条记录")
+        return
+    old_zones = (snapshot or {}).get("zones", {})
+
     print("[*] [CF-DNS] 正在同步 Cloudflare 所有 DNS 记录...")
+    started = time.perf_counter()
+    session = create_cf_session(api_token, max_workers)
     try:
-        headers = {
-            "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json"
-        }
-        
         # 1. 获取所有 Zones
-        zones_resp = requests.get("https://api.cloudflare.com/client/v4/zones", headers=headers, params={"per_page": 50})
-        zones = zones_resp.json().get("result", [])
+        zones = fetch_paginated(session, f"{api_base or API_BASE}/zones", per_page=50)
         
-        temp_cache = []
-        for zone in zones:
-            zone_id = zone['id']
-            # 2. 获取该 Zone 下的所有记录 (支持分页，这里简单取前 1000 条)
-            records_resp = requests.get(
-                f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records", 
-                headers=headers, 
-                params={"per_page": 1000, "type": "A,AAAA"}
-            )
-            records = records_resp.json().get("result", [])
-            for rec in records:
-                temp_cache.append({
-                    "name": rec['name'].lower(),
-                    "content": rec['content'],
-                    "proxied": rec['proxied'],
-                    "type": rec['type']
-                })
-        
-        _cf_cache = temp_cache
-        print(f"[+] [CF-DNS] 同步完成，共加载 {len(_cf_cache)} 条记录")
+        new_zones = {}
+        unchanged = 0
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            # 2. 每个 Zone 先请求第一页：标记与快照一致的直接复用，其余用已取到的第一页继续拉取 (单页 Zone 无需再请求)
+            probes = [(zone, pool.submit(probe_zone, session, zone, api_base)) for zone in zones]
+            stale = []
+            for zone, fut in probes:
+                marker, first_page = fut.result()
+                old = old_zones.get(zone['id'])
+                if marker is not None and old and old.get('marker') == marker:
+                    new_zones[zone['id']] = dict(old, name=zone.get('name', old.get('name', '')))
+                    unchanged += 1
+                else:
+                    stale.append((zone, first_page))
+            if old_zones:
+                print(f"[*] [CF-DNS] {unchanged} 个 Zone 未变化，{len(stale)} 个需要重新同步")
+
+            futures = [(zone, pool.submit(fetch_zone_records, session, zone, api_base, first_page))
+                       for zone, first_page in stale]
+            for zone, fut in futures:
+                records, marker, elapsed = fut.result()
+                print(f"  [*] [CF-DNS] {zone.get('name', zone['id'])}: {len(records)} 条记录, 耗时 {elapsed:.2f}s")
+                new_zones[zone['id']] = {
+                    "name": zone.get('name', ''),
+                    "marker": marker,
+                    "records": records
+                }
+
+        # 按 Zone 原始顺序合并，保证结果稳定
+        snapshot = {"synced_at": time.time(), "zones": {z['id']: new_zones[z['id']] for z in zones}}
+        set_cf_records(_snapshot_records(snapshot))
+        save_cf_snapshot(snapshot_file, snapshot)
+        print(f"[+] [CF-DNS] 同步完成，共 {len(zones)} 个 Zone，加载 {len(_cf_cache)} 条记录 (精确 {len(_cf_exact)} 条)，耗时 {time.perf_counter() - started:.2f}s")
     except Exception as e:
         print(f"[!] [CF-DNS] 同步失败: {e}")
+        # 同步失败时退回到过期快照，总比没有数据好
+        if old_zones and not _cf_cache:
+            set_cf_records(_snapshot_records(snapshot or {"zones": old_zones}))
+            print(f"[*] [CF-DNS] 已回退到过期快照，共 {len(_cf_cache)} 条记录")
+    finally:
+        session.close()
+
+def get_cf_records():
+    """当前内存中的 CF 记录列表"""
+    return _cf_cache
 
 def resolve_domain_with_cache(domain):
     """
     使用本地缓存的记录进行匹配 (支持精确和泛域名)
+    精确匹配走字典，泛域名沿后缀 trie 向下查找，最长 (最具体) 的泛域名胜出，复杂度 O(标签数)
     返回完整的 record 字典，如果没找到则返回 None
     """
-    global _cf_cache
     if not _cf_cache:
         return None
-        
-    dom_lower = domain.lower()
+    return lookup_cf_index(_cf_exact, _cf_wildcards, domain)
+
+def lookup_cf_index(exact, wildcards, domain):
+    """在 build_cf_index 构建的索引中查找域名 (纯函数)"""
+    dom_lower = domain.lower().rstrip('.')
     
     # 1. 精确匹配
-    for rec in _cf_cache:
-        if rec['name'] == dom_lower:
-            return rec
+    rec = exact.get(dom_lower)
+    if rec:
+        return rec
             
-    # 2. 泛域名匹配
-    for rec in _cf_cache:
-        if '*' in rec['name']:
-            suffix = rec['name'].replace('*', '')
-            if dom_lower.endswith(suffix) and dom_lower != suffix.lstrip('.'):
-                return rec
+    # 2. 泛域名匹配：*.example.com 至少要覆盖一级子域名，不匹配 example.com 本身
+    labels = dom_lower.split('.')
+    node = wildcards
+    best = node.get(WILDCARD_KEY)
+    for depth, label in enumerate(reversed(labels), 1):
+        node = node.get(label)
+        if node is None:
+            break
+        if depth < len(labels) and WILDCARD_KEY in node:
+            best = node[WILDCARD_KEY]
                 
-    return None
+    return best
 
 def get_lucky_server_ip(lucky_url):
     """从 Lucky URL 中解析出服务器的 IP"""
@@ -78,7 +271,7 @@ def get_lucky_server_ip(lucky_url):
         from urllib.parse import urlparse
         parsed = urlparse(lucky_url)
         hostname = parsed.hostname
-        return socket.gethostbyname(hostname)
+        return get_resolver().resolve(hostname)
     except:
         return None
 
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import time
+
+from pipeline import Pipeline
+from watcher import FileWatcher
+
+CONFIG_FILE = 'config.json'
+TERMINAL_NAMES_FILE = 'terminal_names.json'
+
+# 各数据源的默认刷新间隔 (秒)；Lucky 节点按各自的 cache_ttl 过期，tick 为检查周期
+DEFAULT_INTERVALS = {
+    "tick": 30,
+    "frp_interval": 300,
+    "cf_interval": 1800,
+    "favicon_interval": 86400,
+    "lucky_retry": 300,
+}
+
+
+class GotLuckyDaemon:
+    """
+    常驻模式：在同一个 Pipeline 上循环刷新，浏览器 / HTTP 连接池 / DNS 与 CF 缓存 / FRP 映射在各轮之间保持在内存中
+    - 每个 tick 检查一次哪些数据源到期：FRP 与 CF 按各自的间隔，Lucky 节点按 cache_ttl 过期；到期的数据源并发刷新
+    - 没有任何数据源刷新的 tick 什么也不做
+    - 整合结果的内容哈希不变且图标未到期时，跳过图标处理与页面生成
+    - 开启文件监听时，frpc unit / 配置、config.json、terminal_names.json 的变化立即生效：
+      FRP 变化只重新溯源受影响端口的服务，terminal_names 变化只重新生成页面
+    """
+    def __init__(self, pipeline, intervals=None):
+        self.pipeline = pipeline
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.last_run = {}
+        self.last_digest = None
+        self.lucky_services = []
+        self.lucky_attempts = {}
+        self.final_data = None
+        self.cycles = 0
+        self.watcher = None
+        self._lock = asyncio.Lock()
+
+    def _due(self, source, now):
+        last = self.last_run.get(source)
+        return last is None or now - last >= self.intervals[f"{source}_interval"]
+
+    async def run_cycle(self, force=False):
+        """执行一轮刷新，返回是否重新生成了页面。force=True 时无论数据是否变化都重新整合并生成"""
+        pipeline = self.pipeline
+        pipeline.timer.reset()
+        now = time.time()
+        first = self.cycles == 0
+        self.cycles += 1
+
+        # 到期的数据源并发刷新 (FRP / CF 在线程中，Lucky 在事件循环中)，全部完成后再整合
+        old_frp = pipeline.frp_mappings
+        tasks = {}
+        if self._due("frp", now):
+            tasks["frp"] = asyncio.to_thread(pipeline.scan_frp)
+            self.last_run["frp"] = now
+
+        # 抓取失败的节点不会更新缓存，至少间隔 lucky_retry 秒再重试，避免每个 tick 都请求
+        to_fetch, _ = pipeline.plan_lucky()
+        retry = [ls for ls in to_fetch if now - self.lucky_attempts.get(ls['name'], 0) >= self.intervals["lucky_retry"]]
+        if first or retry or force:
+            for ls in to_fetch:
+                self.lucky_attempts[ls['name']] = now
+            tasks["lucky"] = pipeline.refresh_lucky()
+
+        if self._due("cf", now):
+            # 首轮允许直接使用未过期的本地快照，之后每次到期都按 Zone 增量同步
+            tasks["cf"] = asyncio.to_thread(pipeline.sync_cf, False, None if first else 0)
+            self.last_run["cf"] = now
+
+        results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        if "lucky" in results:
+            self.lucky_services = results["lucky"]
+        refreshed = [name for name in tasks if name != "frp" or first or pipeline.frp_mappings != old_frp]
+
+        icons_due = self._due("favicon", now)
+        if not refreshed and not icons_due and not force:
+            pipeline.timer.print_summary(f"第 {self.cycles} 轮耗时")
+            return False
+
+        final_data = pipeline.resolve(self.lucky_services)
+        digest = pipeline.digest(final_data)
+        if digest == self.last_digest and not icons_due and not force:
+            print(f"[*] [serve] 第 {self.cycles} 轮: 数据未变化 (刷新: {', '.join(refreshed)})，跳过生成")
+            pipeline.timer.print_summary(f"第 {self.cycles} 轮耗时")
+            return False
+
+        pipeline.fetch_icons(final_data)
+        self.last_run["favicon"] = now
+        await pipeline.generate(final_data)
+        self.final_data = final_data
+        self.last_digest = digest
+        print(f"[+] [serve] 第 {self.cycles} 轮: 页面已重新生成 (刷新: {', '.join(refreshed) or 'favicon'})")
+        pipeline.timer.print_summary(f"第 {self.cycles} 轮耗时")
+        return True
+
+    def watch_targets(self):
+        """需要监听的文件：config.json、terminal_names.json、frpc 配置，以及 systemd_dir 下的 frpc*.service"""
+        files = [CONFIG_FILE, TERMINAL_NAMES_FILE] + list(self.pipeline.frp_config_paths)
+        systemd_dir = self.pipeline.config.get("systemd_dir", "/lib/systemd/system")
+        return files, {systemd_dir: ["frpc*.service"]}
+
+    async def apply_frp_change(self):
+        """重新扫描 FRP (未变化的文件命中解析缓存)，只重新溯源受影响的服务"""
+        pipeline = self.pipeline
+        old = pipeline.frp_mappings
+        await asyncio.to_thread(pipeline.scan_frp)
+        self.last_run["frp"] = time.time()
+        if pipeline.frp_mappings == old:
+            print("[*] [watch] FRP 映射未变化")
+            return False
+        affected = pipeline.resolve_frp_delta(self.lucky_services, self.final_data, old)
+        print(f"[*] [watch] FRP 映射已变化，重新溯源 {len(affected)} 个相关服务")
+        if affected:
+            pipeline.fetch_icons([self.final_data[i] for i in affected])
+        return True
+
+    async def apply_changes(self, changed):
+        """处理一批文件变化"""
+        pipeline = self.pipeline
+        pipeline.timer.reset()
+        names = ", ".join(sorted(os.path.basename(p) for p in changed))
+        print(f"[*] [watch] 检测到文件变化: {names}")
+
+        if os.path.abspath(TERMINAL_NAMES_FILE) in changed:
+            terminal_names = _read_json(TERMINAL_NAMES_FILE, {})
+            if terminal_names is not None:
+                pipeline.terminal_names = terminal_names
+
+        if os.path.abspath(CONFIG_FILE) in changed:
+            config = _read_json(CONFIG_FILE)
+            if config is None:
+                return
+            print("[*] [watch] config.json 已变化，重新加载配置并重新整合")
+            pipeline.reload_config(config)
+            # systemd_dir 可能也变了，FRP 一并重新扫描
+            self.last_run.pop("frp", None)
+            await self.run_cycle(force=True)
+            return
+
+        if self.final_data is None:
+            # 首轮尚未完成，交给下一个 tick 处理
+            return
+        regenerate = os.path.abspath(TERMINAL_NAMES_FILE) in changed
+        if changed - {os.path.abspath(TERMINAL_NAMES_FILE)}:
+            regenerate = await self.apply_frp_change() or regenerate
+        if regenerate:
+            await pipeline.generate(self.final_data)
+            self.last_digest = pipeline.digest(self.final_data)
+            pipeline.timer.print_summary("[watch] 增量更新耗时")
+
+    def rewatch(self):
+        """FRP 配置列表可能变化，更新监听目标"""
+        if self.watcher is not None:
+            self.watcher.watch(*self.watch_targets())
+
+    async def watch_forever(self):
+        print(f"[*] [watch] 文件监听已启动 ({self.watcher.backend})")
+        while True:
+            self.rewatch()
+            changed = await self.watcher.wait()
+            async with self._lock:
+                try:
+                    await self.apply_changes(changed)
+                except Exception as e:
+                    print(f"[!] [watch] 处理文件变化失败: {e}")
+
+    async def tick_forever(self):
+        tick = self.intervals["tick"]
+        while True:
+            async with self._lock:
+                try:
+                    await self.run_cycle()
+                except Exception as e:
+                    # 单轮失败不退出，下一个 tick 重试
+                    print(f"[!] [serve] 第 {self.cycles} 轮执行失败: {e}")
+                self.rewatch()
+            await asyncio.sleep(tick)
+
+    async def serve_forever(self, watcher=None):
+        tick = self.intervals["tick"]
+        print(f"[*] [serve] 常驻模式已启动，检查周期 {tick}s "
+              f"(FRP {self.intervals['frp_interval']}s / CF {self.intervals['cf_interval']}s / "
+              f"图标 {self.intervals['favicon_interval']}s，Lucky 按 cache_ttl)")
+        self.watcher = watcher
+        if watcher is None:
+            await self.tick_forever()
+        else:
+            await asyncio.gather(self.tick_forever(), self.watch_forever())
+
+
+def _read_json(path, default=None):
+    """读取 JSON 文件，失败时打印原因并返回 None (文件不存在时返回 default)"""
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[!] 读取 {path} 失败: {e}")
+        return None
+
+
+async def serve(config, terminal_names=None):
+    """python main.py serve 的入口，替代 cron 定时执行"""
+    serve_config = config.get("serve", {})
+    intervals = {key: serve_config[key] for key in DEFAULT_INTERVALS if key in serve_config}
+    pipeline = Pipeline(config, terminal_names, keep_warm=True)
+    watcher = None
+    if serve_config.get("watch", True):
+        watcher = FileWatcher(poll_interval=serve_config.get("watch_poll_interval", 2))
+    try:
+        await GotLuckyDaemon(pipeline, intervals).serve_forever(watcher)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+        await pipeline.close()
+        print("[*] [serve] 已停止")
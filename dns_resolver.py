@@ -0,0 +1,89 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class DnsResolver:
+    """
+    带 TTL 的 DNS 解析缓存 (线程安全)
+    - 成功结果缓存 ttl 秒，失败结果缓存 negative_ttl 秒 (负缓存)
+    - resolve_many 在线程池中并发解析所有未缓存的主机名
+    """
+    def __init__(self, ttl=300, negative_ttl=60, max_workers=16):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self._cache = {}  # host ➔ (ip 或 None, 过期时间)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def _lookup(self, host):
+        with self._lock:
+            entry = self._cache.get(host)
+            if entry and entry[1] > time.time():
+                self.hits += 1
+                if entry[0] is None:
+                    self.negative_hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def _store(self, host, ip):
+        expires = time.time() + (self.ttl if ip else self.negative_ttl)
+        with self._lock:
+            self._cache[host] = (ip, expires)
+
+    def _query(self, host):
+        try:
+            ip = socket.gethostbyname(host)
+        except Exception:
+            ip = None
+        self._store(host, ip)
+        return ip
+
+    def resolve(self, host):
+        """解析单个主机名，失败返回 None"""
+        if not host:
+            return None
+        host = host.lower()
+        cached, ip = self._lookup(host)
+        if cached:
+            return ip
+        return self._query(host)
+
+    def resolve_many(self, hosts):
+        """并发解析一批主机名 (去重)，返回 {host: ip 或 None}"""
+        unique = {h.lower() for h in hosts if h}
+        results, pending = {}, []
+        for host in unique:
+            cached, ip = self._lookup(host)
+            if cached:
+                results[host] = ip
+            else:
+                pending.append(host)
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as pool:
+                for host, ip in zip(pending, pool.map(self._query, pending)):
+                    results[host] = ip
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits
+            }
+
+    def print_stats(self):
+        st = self.stats()
+        print(f"[*] [DNS] 缓存条目 {st['entries']}，命中 {st['hits']} (负缓存 {st['negative_hits']})，未命中 {st['misses']}")
+
+_default_resolver = DnsResolver()
+
+def get_resolver():
+    """进程内共享的解析器实例"""
+    return _default_resolver
@@ -0,0 +1,371 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from output_writer import write_if_changed
+from placeholder import PlaceholderRenderer
+
+# 禁用 HTTPS 证书验证警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+GOOGLE_FAVICON_BASE = "https://www.google.com"
+
+def use_existing_icons(final_data, favicons_dir):
+    """skipicon 模式：确保每个条目的 icon 路径仍然指向现有的本地文件（如果存在）"""
+    for s in final_data:
+        domain = s['domain']
+        real_path = os.path.join(favicons_dir, f"{domain}.png")
+        pillow_path = os.path.join(favicons_dir, f"{domain}.pillow.png")
+        if os.path.exists(real_path):
+            s['icon'] = f"favicons/{domain}.png"
+        elif os.path.exists(pillow_path):
+            s['icon'] = f"favicons/{domain}.pillow.png"
+        else:
+            s['icon'] = "favicons/default.png"
+
+class FaviconManifest:
+    """
+    图标元数据清单 (favicons/manifest.json)，每个域名记录:
+    source_url / etag / last_modified / hash / last_checked / last_attempt / failures
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"[!] 读取图标清单失败: {e}")
+
+    def get(self, domain):
+        with self._lock:
+            return dict(self.entries.get(domain, {}))
+
+    def update(self, domain, **fields):
+        with self._lock:
+            self.entries.setdefault(domain, {}).update(fields)
+
+    def save(self):
+        try:
+            with self._lock:
+                write_if_changed(self.path, json.dumps(self.entries, ensure_ascii=False, indent=2, sort_keys=True))
+        except Exception as e:
+            print(f"[!] 保存图标清单失败: {e}")
+
+class FaviconFetcher:
+    """
+    并发图标下载器
+    - 所有请求共用一个带连接池的 Session (按主机复用连接；所有域名都会访问的 Google 接口单独按 max_workers 分配连接)
+    - 线程池大小即全局并发上限；同一域名 (不同端口 / 节点上的多条记录) 只处理一次，结果分发给所有记录
+    - 每个域名有总时限 deadline 秒，超时后不再尝试后续的备选来源
+    回退顺序与文件语义保持不变：直连 /favicon.ico ➔ 解析首页 <link rel=icon> ➔ Google 接口 ➔ Pillow 占位图
+    成功保存为 {domain}.png (并清理 .pillow.png)，占位图保存为 {domain}.pillow.png
+    清单 (FaviconManifest) 用于：
+    - 失败的域名按 failures 指数退避，退避期内不访问网络
+    - 已有图标每隔 revalidate_after 秒用 If-None-Match / If-Modified-Since 条件请求重新验证
+    """
+    def __init__(self, favicons_dir, max_workers=16, per_host=4, deadline=15,
+                 revalidate_after=7 * 86400, backoff_base=3600, backoff_max=7 * 86400):
+        self.favicons_dir = favicons_dir
+        self.max_workers = max(1, max_workers)
+        self.deadline = deadline
+        self.revalidate_after = revalidate_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.manifest = FaviconManifest(os.path.join(favicons_dir, 'manifest.json'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(32, self.max_workers * 2), pool_maxsize=max(per_host, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.mount(GOOGLE_FAVICON_BASE, HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers))
+        self.placeholders = PlaceholderRenderer()
+
+    def close(self):
+        self.session.close()
+
+    def _backoff_until(self, entry):
+        failures = entry.get("failures", 0)
+        if not failures:
+            return 0
+        return entry.get("last_attempt", 0) + min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+
+    def _record_success(self, domain, url, resp, content):
+        self.manifest.update(
+            domain,
+            source_url=url,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            hash=hashlib.sha256(content).hexdigest()[:16],
+            last_checked=time.time(),
+            last_attempt=time.time(),
+            failures=0
+        )
+
+    def _save_icon(self, domain, url, resp, path):
+        # 原子写入：中途崩溃不会留下被截断、却被下次条件请求当作有效的图标
+        write_if_changed(path, resp.content)
+        self._record_success(domain, url, resp, resp.content)
+
+    def _revalidate(self, domain, entry, path, log):
+        """条件请求重新验证已有图标，返回状态"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            r = self._get(entry["source_url"], 3, time.perf_counter() + self.deadline, headers=headers, verify=False)
+        except Exception as e:
+            # 验证失败不影响现有图标，下次再试
+            log.append(f"  [#] 图标重新验证失败，保留现有图标: {domain} ({str(e)[:50]})")
+            self.manifest.update(domain, last_checked=time.time())
+            return "exists"
+        if r.status_code == 304:
+            self.manifest.update(domain, last_checked=time.time())
+            log.append(f"  [#] 图标未变化 (304): {domain}")
+            return "revalidated"
+        if r.status_code == 200 and len(r.content) > 100:
+            new_hash = hashlib.sha256(r.content).hexdigest()[:16]
+            if new_hash != entry.get("hash"):
+                write_if_changed(path, r.content)
+                log.append(f"  [+] 图标已更新: {domain} ✅")
+                self._record_success(domain, entry["source_url"], r, r.content)
+                return "updated"
+            self._record_success(domain, entry["source_url"], r, r.content)
+            log.append(f"  [#] 图标内容未变化: {domain}")
+            return "revalidated"
+        self.manifest.update(domain, last_checked=time.time())
+        log.append(f"  [#] 图标来源不可用 (HTTP {r.status_code})，保留现有图标: {domain}")
+        return "exists"
+
+    def _get(self, url, timeout, expires_at, **kwargs):
+        remaining = expires_at - time.perf_counter()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("已超过该域名的总时限")
+        return self.session.get(url, timeout=min(timeout, remaining), **kwargs)
+
+    def fetch(self, s):
+        """
+        为单个条目获取图标并设置 s['icon']
+        返回 (状态, 日志行列表)；日志集中输出，避免多线程下交错
+        """
+        domain = s['domain']
+        access_url = s['access_url']
+        log = []
+
+        real_icon_path = os.path.join(self.favicons_dir, f"{domain}.png")
+        pillow_icon_path = os.path.join(self.favicons_dir, f"{domain}.pillow.png")
+
+        entry = self.manifest.get(domain)
+        now = time.time()
+
+        # 初始检查：如果已经有真实图标，直接使用 (到期的才做一次条件请求重新验证)
+        if os.path.exists(real_icon_path):
+            s['icon'] = f"favicons/{domain}.png"
+            if entry.get("source_url") and now - entry.get("last_checked", 0) >= self.revalidate_after:
+                return self._revalidate(domain, entry, real_icon_path, log), log
+            log.append(f"  [#] 真实图标已存在: {domain}")
+            return "exists", log
+
+        # 之前失败过的域名处于退避期内时，不访问网络
+        retry_at = self._backoff_until(entry)
+        if retry_at > now:
+            log.append(f"  [~] 失败退避中 (已失败 {entry.get('failures')} 次，{(retry_at - now) / 3600:.1f}h 后重试): {domain}")
+            if not os.path.exists(pillow_icon_path):
+                # 占位图被清理过：不访问网络，只在批量渲染时重新生成
+                log.append(f"    [*] 占位图标缺失，重新生成")
+                return "placeholder", log
+            s['icon'] = f"favicons/{domain}.pillow.png"
+            return "backoff", log
+
+        # 如果只有 Pillow 图标或者什么都没有，则进入下载逻辑
+        is_retry = os.path.exists(pillow_icon_path)
+        log.append(f"  [>] {'尝试更新占位图标' if is_retry else '准备下载新图标'} | 域: {domain}")
+
+        expires_at = time.perf_counter() + self.deadline
+        success = False
+
+        # 1. 尝试从服务的直接地址获取 /favicon.ico
+        try:
+            parsed = urlparse(access_url)
+            base_url = f"{parsed.scheme}://{parsed.netloc}"
+            target_favicon = urljoin(base_url, '/favicon.ico')
+            log.append(f"    - 正在尝试直连探测: {target_favicon}")
+
+            r = self._get(target_favicon, 3, expires_at, verify=False)
+            if r.status_code == 200 and len(r.content) > 100:
+                self._save_icon(domain, target_favicon, r, real_icon_path)
+                log.append(f"    [+] 直连下载成功! ✅")
+                success = True
+            else:
+                log.append(f"    [!] 直连不可用 (HTTP {r.status_code})")
+        except requests.exceptions.SSLError:
+            log.append(f"    [!] 直连失败: SSL 证书错误")
+        except requests.exceptions.ConnectionError:
+            log.append(f"    [!] 直连失败: 无法建立连接")
+        except requests.exceptions.Timeout:
+            log.append(f"    [!] 直连失败: 请求超时")
+        except Exception as e:
+            log.append(f"    [!] 直连请求异常: {str(e)[:50]}...")
+
+        # 2. 如果直连探测失败，尝试解析网页 HTML 源码寻找图标路径
+        if not success:
+            try:
+                log.append(f"    - 正在分析首页 HTML 源码: {access_url}")
+                r_html = self._get(access_url, 5, expires_at, verify=False)
+                if r_html.status_code == 200:
+                    pattern = r'<link[^>]+rel=["\'](?:shortcut )?icon["\'][^>]+href=["\']([^"\']+)["\']'
+                    match = re.search(pattern, r_html.text, re.IGNORECASE)
+                    if not match:
+                        pattern_alt = r'<link[^>]+href=["\']([^"\']+)["\'][^>]+rel=["\'](?:shortcut )?icon["\']'
+                        match = re.search(pattern_alt, r_html.text, re.IGNORECASE)
+
+                    if match:
+                        icon_href = match.group(1)
+                        target_favicon = urljoin(access_url, icon_href)
+                        log.append(f"    - 发现网页内嵌图标路径: {target_favicon}")
+                        r_icon = self._get(target_favicon, 3, expires_at, verify=False)
+                        if r_icon.status_code == 200 and len(r_icon.content) > 100:
+                            self._save_icon(domain, target_favicon, r_icon, real_icon_path)
+                            log.append(f"    [+] 从网页源码解析下载成功 ✅")
+                            success = True
+                else:
+                    log.append(f"    [!] 首页加载失败 (HTTP {r_html.status_code})")
+            except Exception as e:
+                log.append(f"    [!] 源码分析异常: {str(e)[:50]}")
+
+        # 3. 如果还是失败，使用 Google Favicon 服务
+        if not success:
+            try:
+                google_url = f"{GOOGLE_FAVICON_BASE}/s2/favicons?domain={domain}&sz=64"
+                log.append(f"    - 正在尝试 Google 备选接口: {google_url}")
+                r = self._get(google_url, 5, expires_at)
+                if r.status_code == 200 and len(r.content) > 500:
+                    self._save_icon(domain, google_url, r, real_icon_path)
+                    log.append(f"    [+] Google 接口下载成功 ✅")
+                    success = True
+            except Exception as e:
+                log.append(f"    [!] Google 接口失败: {str(e)[:50]}")
+
+        # 4. 设置最终使用的图标路径，并决定是否要清理 Pillow 图标
+        if success:
+            s['icon'] = f"favicons/{domain}.png"
+            if os.path.exists(pillow_icon_path):
+                try: os.remove(pillow_icon_path)
+                except: pass
+            return "downloaded", log
+
+        # 所有下载均失败：记录失败次数用于退避，只能用 Pillow 兜底 (在 fetch_all 末尾批量生成)
+        self.manifest.update(domain, last_attempt=time.time(), failures=entry.get("failures", 0) + 1)
+        log.append(f"    [*] 将使用本地占位图标")
+        return "placeholder", log
+
+    def render_placeholders(self, items):
+        """批量生成占位图标 (颜色由域名决定，内容未变化的文件不重写)，并设置各条目的 icon"""
+        if not items:
+            return
+        paths = [(s['domain'], os.path.join(self.favicons_dir, f"{s['domain']}.pillow.png")) for s in items]
+        try:
+            written, skipped = self.placeholders.render_batch(paths)
+            print(f"[+] 占位图标: 写入 {written} 个，未变化跳过 {skipped} 个 ✅")
+        except Exception as e:
+            print(f"[!] 本地图标生成彻底失败: {e}")
+        for s, (_, path) in zip(items, paths):
+            s['icon'] = f"favicons/{s['domain']}.pillow.png" if os.path.exists(path) else "favicons/default.png"
+
+    def _collect_result(self, s, get_result, progress):
+        """汇总单个条目的处理结果并输出日志 (在调用方线程中执行，避免日志交错)"""
+        try:
+            status, log, elapsed = get_result()
+        except Exception as e:
+            status, log, elapsed = "error", [f"  [!] {s['domain']} 图标处理异常: {e}"], 0.0
+            s['icon'] = "favicons/default.png"
+        progress["counts"][status] = progress["counts"].get(status, 0) + 1
+        if status == "placeholder":
+            progress["placeholders"].append(s)
+        if status != "exists":
+            log[0] += f" ({elapsed:.1f}s)"
+        progress["done"] += 1
+        total = progress.get("total")
+        print((f"[{progress['done']}/{total}]" if total else f"[{progress['done']}]") + "\n".join(log))
+
+    def _finish(self, groups, progress, started):
+        """groups: {域名: [记录, ...]}，每组第一条记录是实际处理的那条"""
+        # 按原始顺序批量渲染，保证输出稳定
+        order = {id(items[0]): i for i, items in enumerate(groups.values())}
+        self.render_placeholders(sorted(progress["placeholders"], key=lambda s: order[id(s)]))
+        # 同域名的其余记录沿用处理结果
+        for first, *rest in groups.values():
+            for s in rest:
+                s['icon'] = first.get('icon', "favicons/default.png")
+        self.manifest.save()
+        records = sum(len(items) for items in groups.values())
+        summary = ", ".join(f"{k} {v}" for k, v in progress["counts"].items())
+        print(f"[+] 图标处理完成: {len(groups)} 个域名 / {records} 条记录 ({summary})，耗时 {time.perf_counter() - started:.1f}s")
+
+    def fetch_all(self, final_data):
+        """并发处理所有条目 (按域名去重)，输出进度与耗时汇总"""
+        started = time.perf_counter()
+        groups = {}
+        for s in final_data:
+            groups.setdefault(s['domain'], []).append(s)
+        progress = {"done": 0, "total": len(groups), "counts": {}, "placeholders": []}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._timed_fetch, items[0]): items[0] for items in groups.values()}
+            for fut in as_completed(futures):
+                self._collect_result(futures[fut], fut.result, progress)
+        self._finish(groups, progress, started)
+
+    async def fetch_queue(self, queue):
+        """
+        流式处理：从 asyncio.Queue 中逐个取出条目 (None 表示结束) 交给线程池，
+        同时在处理中的条目不超过 max_workers 个，队列满时生产者自然被阻塞。
+        已提交过的域名不再重复处理，结束时统一沿用第一条记录的结果。返回处理过的条目列表
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        progress = {"done": 0, "total": None, "counts": {}, "placeholders": []}
+        items, pending, groups = [], [], {}
+        slots = asyncio.Semaphore(self.max_workers)
+
+        async def run(s, pool):
+            fut = loop.run_in_executor(pool, self._timed_fetch, s)
+            try:
+                # 只等待完成，结果 (或异常) 交给 _collect_result 统一处理
+                await asyncio.wait({fut})
+                self._collect_result(s, fut.result, progress)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while True:
+                s = await queue.get()
+                if s is None:
+                    break
+                items.append(s)
+                if s['domain'] in groups:
+                    groups[s['domain']].append(s)
+                    continue
+                groups[s['domain']] = [s]
+                await slots.acquire()
+                pending.append(asyncio.ensure_future(run(s, pool)))
+            await asyncio.gather(*pending)
+        self._finish(groups, progress, started)
+        return items
+
+    def _timed_fetch(self, s):
+        started = time.perf_counter()
+        status, log = self.fetch(s)
+        return status, log, time.perf_counter() - started
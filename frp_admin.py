@@ -0,0 +1,138 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scanner_frp import parse_frp_text
+
+DEFAULT_TIMEOUT = 3
+
+
+def create_admin_session(pool_size=8):
+    """frpc 管理接口共用的带连接池的 Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _split_port(addr):
+    """'127.0.0.1:22' ➔ ('127.0.0.1', '22')；':6000' ➔ ('', '6000')；没有数字端口时返回 (addr, None)"""
+    host, sep, port = (addr or "").rpartition(':')
+    if not sep or not port.isdigit() or '/' in port:
+        return addr, None
+    return host, port
+
+
+def status_to_mappings(status, config_mappings, server_addr, source):
+    """
+    合并 /api/status 与 /api/config 的结果:
+    - 以配置中的代理为准 (带 server_addr / 端口范围展开后的名称)，用 status 标记是否在运行
+    - 只出现在 status 中的代理 (例如通过 store API 动态添加的) 由 local_addr / remote_addr 还原端口
+    - http / https 等没有数字 remote 端口的代理跳过，与配置文件解析保持一致
+    """
+    running = {}
+    live = []
+    for proxies in (status or {}).values():
+        for p in proxies or []:
+            if not isinstance(p, dict) or 'name' not in p:
+                continue
+            running[p['name']] = p.get('status') == 'running'
+            live.append(p)
+
+    mappings = []
+    for m in config_mappings:
+        m = dict(m, source_file=source)
+        m['running'] = running.get(m['name'], False)
+        mappings.append(m)
+
+    known = {m['name'] for m in mappings}
+    for p in live:
+        if p['name'] in known:
+            continue
+        local_ip, local_port = _split_port(p.get('local_addr'))
+        remote_host, remote_port = _split_port(p.get('remote_addr'))
+        if not local_port or not remote_port:
+            continue
+        mappings.append({
+            'name': p['name'],
+            'local_ip': local_ip or "127.0.0.1",
+            'local_port': local_port,
+            'remote_port': remote_port,
+            'server_addr': server_addr if server_addr != 'unknown' else (remote_host or 'unknown'),
+            'source_file': source,
+            'running': p.get('status') == 'running'
+        })
+    return mappings
+
+
+def fetch_frpc_admin(session, endpoint, timeout=DEFAULT_TIMEOUT):
+    """
+    查询单个 frpc 的管理接口 (webServer)，返回 (映射列表, 耗时)
+    endpoint: {"url": "http://127.0.0.1:7400", "user": ..., "pass": ..., "name": 可选的显示名}
+    """
+    started = time.perf_counter()
+    base = endpoint['url'].rstrip('/')
+    source = endpoint.get('name') or f"frpc-admin@{urlparse(base).netloc}"
+    auth = (endpoint['user'], endpoint.get('pass', '')) if endpoint.get('user') else None
+
+    status_resp = session.get(f"{base}/api/status", auth=auth, timeout=timeout)
+    status_resp.raise_for_status()
+
+    # /api/config 返回原始配置文本，用于拿到 serverAddr 以及完整的端口定义；取不到时只用 status
+    config_mappings, server_addr = [], 'unknown'
+    try:
+        config_resp = session.get(f"{base}/api/config", auth=auth, timeout=timeout)
+        if config_resp.status_code == 200 and config_resp.text.strip():
+            config_mappings = parse_frp_text(config_resp.text, source)
+            if config_mappings:
+                server_addr = config_mappings[0]['server_addr']
+    except Exception as e:
+        print(f"  [!] [frpc-admin] {source} 读取配置失败: {e}")
+
+    mappings = status_to_mappings(status_resp.json(), config_mappings, server_addr, source)
+    return mappings, time.perf_counter() - started
+
+
+def collect_frpc_admin(endpoints, timeout=DEFAULT_TIMEOUT, max_workers=8):
+    """并发查询所有 frpc 管理接口，结果按 endpoints 的顺序拼接；单个接口失败不影响其他接口"""
+    if not endpoints:
+        return []
+    session = create_admin_session(max(1, min(max_workers, len(endpoints))))
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(endpoints)))) as pool:
+            futures = [(ep, pool.submit(fetch_frpc_admin, session, ep, timeout)) for ep in endpoints]
+            for ep, fut in futures:
+                try:
+                    mappings, elapsed = fut.result()
+                    active = sum(1 for m in mappings if m.get('running'))
+                    print(f"  [*] [frpc-admin] {ep['url']}: {len(mappings)} 个映射 ({active} 个运行中), 耗时 {elapsed:.2f}s")
+                    results.extend(mappings)
+                except Exception as e:
+                    print(f"  [!] [frpc-admin] {ep.get('url')} 查询失败: {e}")
+    finally:
+        session.close()
+    return results
+
+
+def merge_mappings(file_mappings, admin_mappings):
+    """
+    合并配置文件扫描结果与管理接口结果：同一代理 (name + server_addr) 以管理接口的实时数据为准，
+    其余保持配置文件扫描结果的原有顺序，只存在于管理接口中的代理追加在最后
+    """
+    live = {(m['name'], m['server_addr']): m for m in admin_mappings}
+    merged, used = [], set()
+    for m in file_mappings:
+        key = (m['name'], m['server_addr'])
+        if key in live:
+            if key not in used:
+                merged.append(dict(live[key], source_file=m['source_file']))
+                used.add(key)
+        else:
+            merged.append(m)
+    merged.extend(m for key, m in live.items() if key not in used)
+    return merged
@@ -0,0 +1,82 @@
+import re
+
+# 视为“本机”的地址
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '0.0.0.0')
+_IPV4_RE = re.compile(r'^\d+\.\d+\.\d+\.\d+$')
+
+class FrpIndex:
+    """
+    FRP 映射索引，由 scanner_frp.parse_frp_config 的输出一次性构建:
+    - 前置 FRP (入口 ➔ FRPS ➔ Lucky)：按 (FRPS 解析后的 IP, 端口) 索引，端口同时包含 remote_port 和 local_port
+    - 后置 FRP (Lucky ➔ 后端)：按后端端口 (remote_port / local_port) 索引
+    每个键下保留映射的原始顺序，查询结果与逐条遍历时“第一条命中”一致，单次查询 O(1)
+    """
+    def __init__(self, mappings, resolve_server=None):
+        """
+        mappings: FRP 映射字典列表
+        resolve_server: 把非 IP 的 server_addr 解析为 IP 的函数 (每个地址只调用一次)
+        """
+        self.mappings = list(mappings)
+        self._server_ips = {}
+        self._by_server_port = {}
+        self._by_backend_port = {}
+
+        for fm in self.mappings:
+            f_server = fm.get('server_addr', '').lower()
+            p_remote = str(fm.get('remote_port'))
+            p_local = str(fm.get('local_port'))
+            server_ip = self._resolve(f_server, resolve_server).lower()
+            # 预先计算好匹配时要用的规范化字段，查询时不再重复处理字符串
+            entry = (fm, f_server, fm.get('local_ip', '').lower())
+
+            for port in dict.fromkeys((p_remote, p_local)):
+                self._by_server_port.setdefault((server_ip, port), []).append(entry)
+                self._by_backend_port.setdefault(port, []).append(entry)
+
+    def _resolve(self, f_server, resolve_server):
+        if f_server not in self._server_ips:
+            server_ip = f_server
+            if resolve_server and not _IPV4_RE.match(f_server):
+                server_ip = resolve_server(f_server) or f_server
+            self._server_ips[f_server] = server_ip
+        return self._server_ips[f_server]
+
+    def stale(self, resolve_server):
+        """server_addr 重新解析后与建索引时的结果是否不同 (不同则需要重建索引)"""
+        for f_server, server_ip in self._server_ips.items():
+            if not _IPV4_RE.match(f_server) and (resolve_server(f_server) or f_server) != server_ip:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.mappings)
+
+    def match_pre_lucky(self, service_ip, port, lucky_ip=None):
+        """
+        寻找前置 FRP：server_addr 指向服务域名解析出的 IP，
+        remote_port 或 local_port 等于前端端口，且 local_ip 指向 Lucky 本机
+        """
+        candidates = self._by_server_port.get(((service_ip or '').lower(), str(port)))
+        if not candidates:
+            return None
+        local_ips = LOCAL_HOSTS + ((lucky_ip or "").lower(),)
+        for fm, _, l_ip in candidates:
+            if l_ip in local_ips:
+                return fm
+        return None
+
+    def match_post_lucky(self, backend_port, lucky_ip=None):
+        """
+        寻找后置 FRP：remote_port 或 local_port 等于 Lucky 的后端端口，
+        且 server_addr 是 Lucky 所在服务器 (或本机)
+        """
+        candidates = self._by_backend_port.get(str(backend_port))
+        if not candidates:
+            return None
+        l_ip_target = (lucky_ip or "").lower()
+        for fm, f_server, _ in candidates:
+            # 1. 如果 FRP 连接的地址就是 Lucky 的公网 IP
+            # 2. 如果 Lucky 本身就在本机运行
+            if (l_ip_target and f_server == l_ip_target) or f_server in LOCAL_HOSTS:
+                return fm
+        return None
@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import io
+import math
+import os
+
+ICON_SIZE = 64
+# 透明 1x1 GIF：雪碧图模式下作为 <img> 的 src，图标本身由 CSS 背景绘制
+BLANK_GIF = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+
+def normalize_icon(path, size=ICON_SIZE):
+    """把图标统一缩放为 size×size 的 RGBA PNG (保持比例居中)，返回 PNG 字节；无法解析时返回 None"""
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            # .ico 可能包含多个尺寸，取最大的一帧
+            if getattr(img, "ico", None):
+                img.size = max(img.ico.sizes())
+            img = img.convert("RGBA")
+            img.thumbnail((size, size), Image.LANCZOS)
+            canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+            canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+            buf = io.BytesIO()
+            canvas.save(buf, format="PNG", optimize=True)
+            return buf.getvalue()
+    except Exception:
+        return None
+
+def _collect(final_data, output_dir):
+    """归一化所有本地图标并按内容哈希去重，返回 ({哈希: PNG 字节}, {icon 路径: 哈希})"""
+    unique, path_hash = {}, {}
+    for s in final_data:
+        icon = s.get('icon', '')
+        if icon in path_hash or icon.startswith('data:'):
+            continue
+        data = normalize_icon(os.path.join(output_dir, icon))
+        if data is None:
+            continue
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        unique.setdefault(digest, data)
+        path_hash[icon] = digest
+    return unique, path_hash
+
+def inline_icons(final_data, output_dir, max_bytes=8192):
+    """小于 max_bytes 的图标直接内嵌为 data URI，页面首屏无需任何图片请求"""
+    unique, path_hash = _collect(final_data, output_dir)
+    uris = {h: "data:image/png;base64," + base64.b64encode(d).decode('ascii')
+            for h, d in unique.items() if len(d) <= max_bytes}
+    inlined = 0
+    for s in final_data:
+        digest = path_hash.get(s.get('icon'))
+        if digest in uris:
+            s['icon'] = uris[digest]
+            inlined += 1
+    print(f"[+] 图标内嵌完成: {inlined}/{len(final_data)} 个条目，去重后 {len(uris)} 个图标")
+
+def build_sprite(final_data, output_dir):
+    """
+    把去重后的图标打包成一张雪碧图 favicons/sprite-<哈希>.png，返回需要注入页面的 CSS
+    背景位置使用百分比，因此同一张雪碧图可以适配任意显示尺寸
+    """
+    from PIL import Image
+    unique, path_hash = _collect(final_data, output_dir)
+    if not unique:
+        return ""
+
+    digests = sorted(unique)
+    cols = max(1, math.ceil(math.sqrt(len(digests))))
+    rows = math.ceil(len(digests) / cols)
+    sheet = Image.new("RGBA", (cols * ICON_SIZE, rows * ICON_SIZE), (0, 0, 0, 0))
+    positions = {}
+    for i, digest in enumerate(digests):
+        col, row = i % cols, i // cols
+        with Image.open(io.BytesIO(unique[digest])) as icon:
+            sheet.paste(icon, (col * ICON_SIZE, row * ICON_SIZE))
+        x = col * 100 / (cols - 1) if cols > 1 else 0
+        y = row * 100 / (rows - 1) if rows > 1 else 0
+        positions[digest] = (x, y)
+
+    buf = io.BytesIO()
+    sheet.save(buf, format="PNG", optimize=True)
+    sheet_bytes = buf.getvalue()
+    sprite_name = f"sprite-{hashlib.sha256(sheet_bytes).hexdigest()[:8]}.png"
+    favicons_dir = os.path.join(output_dir, 'favicons')
+    # 清理旧版本的雪碧图 (文件名带内容哈希，天然可以长期缓存)
+    for name in os.listdir(favicons_dir):
+        if name.startswith("sprite-") and name.endswith(".png") and name != sprite_name:
+            try: os.remove(os.path.join(favicons_dir, name))
+            except OSError: pass
+    with open(os.path.join(favicons_dir, sprite_name), 'wb') as f:
+        f.write(sheet_bytes)
+
+    for s in final_data:
+        digest = path_hash.get(s.get('icon'))
+        if digest:
+            s['icon_sprite'] = f"ico-{digest}"
+            s['icon'] = BLANK_GIF
+
+    css = [f".sprite-icon {{ background-image: url(favicons/{sprite_name}); background-size: {cols * 100}% {rows * 100}%; background-repeat: no-repeat; }}"]
+    css.extend(f".ico-{d} {{ background-position: {x:g}% {y:g}%; }}" for d, (x, y) in positions.items())
+    print(f"[+] 雪碧图已生成: favicons/{sprite_name} ({len(digests)} 个去重图标，{len(sheet_bytes) // 1024} KB)")
+    return "\n".join(css)
+
+def bundle_icons(final_data, output_dir, mode):
+    """
+    mode: "inline" 内嵌 data URI / "sprite" 打包雪碧图 / 其他值不处理
+    返回需要注入页面 <style> 的 CSS (仅雪碧图模式)
+    """
+    if mode not in ("inline", "sprite"):
+        return ""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("[!] 未安装 Pillow，跳过图标打包")
+        return ""
+    if mode == "inline":
+        inline_icons(final_data, output_dir)
+        return ""
+    return build_sprite(final_data, output_dir)
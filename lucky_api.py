@@ -0,0 +1,120 @@
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Lucky 管理后台多为自签名证书
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 不同版本的 Lucky 前端使用的鉴权头不同，两个都带上
+AUTH_HEADERS = ("Authorization", "lucky-admin-token")
+DEFAULT_TIMEOUT = (3, 10)
+
+class LuckyApiError(Exception):
+    """Lucky API 不可用 (无法连接 / 登录失败 / 返回格式不认识)，调用方应回退到浏览器抓取"""
+    pass
+
+def create_session(pool_size=10):
+    """创建带连接池的 Session，可在多个 Lucky 节点之间共享"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.verify = False
+    return session
+
+class LuckyApiClient:
+    """
+    直接调用 Lucky 管理后台的 REST API:
+    POST /api/login 换取 token，再 GET /api/webservice/rules 拉取 Web 规则 JSON
+    """
+    def __init__(self, url, username, password, session=None, timeout=DEFAULT_TIMEOUT):
+        # url 可能带有安全入口路径，例如 http://1.2.3.4:16601/666
+        self.base_url = url.split('#')[0].rstrip('/')
+        self.username = username
+        self.password = password
+        self.session = session or create_session()
+        self.timeout = timeout
+        self.token = None
+
+    def _request(self, method, path, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if self.token:
+            for h in AUTH_HEADERS:
+                headers[h] = self.token
+        try:
+            resp = self.session.request(method, self.base_url + path, headers=headers, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            raise LuckyApiError(f"无法连接: {e}")
+        if resp.status_code in (401, 403):
+            return None
+        if resp.status_code != 200:
+            raise LuckyApiError(f"HTTP {resp.status_code}")
+        try:
+            return resp.json()
+        except ValueError:
+            # 返回了 HTML (例如老版本没有该接口)，视为 API 不可用
+            raise LuckyApiError("返回内容不是 JSON")
+
+    def login(self):
+        data = self._request("POST", "/api/login", json={"Account": self.username, "Password": self.password})
+        if not data or data.get("ret") != 0 or not data.get("token"):
+            msg = data.get("msg", "未知原因") if data else "未授权"
+            raise LuckyApiError(f"登录失败: {msg}")
+        self.token = data["token"]
+        return self.token
+
+    def get_web_rules(self):
+        """拉取 Web 服务规则列表，token 失效时自动重新登录一次"""
+        if not self.token:
+            self.login()
+        data = self._request("GET", "/api/webservice/rules")
+        if data is None or data.get("ret") not in (0, None):
+            self.token = None
+            self.login()
+            data = self._request("GET", "/api/webservice/rules")
+        if not data or "rulelist" not in data:
+            raise LuckyApiError("规则接口返回格式无法识别")
+        return data.get("rulelist") or []
+
+def rules_to_services(rule_list):
+    """把 Lucky Web 规则 JSON 映射为 {domain, protocol, internal_addr} 记录 (与 DOM 抓取结果一致)"""
+    unique_services = {}
+    for rule in rule_list:
+        if rule.get("Enable") is False:
+            continue
+        protocol = "https" if rule.get("EnableTLS") else "http"
+        port = str(rule.get("ListenPort") or "")
+        default_port = "443" if protocol == "https" else "80"
+
+        sub_rules = list(rule.get("ProxyList") or [])
+        for sub in sub_rules:
+            if sub.get("Enable") is False:
+                continue
+            locations = [l for l in (sub.get("Locations") or []) if l]
+            # 非反向代理类型 (重定向 / 文件服务等) 没有后端地址时，用类型名代替
+            target = locations[0] if locations else (sub.get("WebServiceType") or "")
+            if not target:
+                continue
+            for d in sub.get("Domains") or []:
+                d = d.strip().lower()
+                if not d:
+                    continue
+                domain_part = d if (not port or port == default_port) else f"{d}:{port}"
+                if domain_part not in unique_services:
+                    unique_services[domain_part] = {
+                        "domain": domain_part,
+                        "protocol": protocol,
+                        "internal_addr": target.strip()
+                    }
+    return list(unique_services.values())
+
+def get_lucky_services_api(url, username, password, server_name="lucky", session=None):
+    """
+    通过 REST API 获取单个 Lucky 节点的服务列表。
+    API 不可用时抛出 LuckyApiError
+    """
+    client = LuckyApiClient(url, username, password, session=session)
+    rules = client.get_web_rules()
+    services = rules_to_services(rules)
+    print(f"[*] {server_name} (API) 最终提取到 {len(services)} 条服务规则")
+    return services
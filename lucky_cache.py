@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import time
+
+from output_writer import dumps_compact, write_if_changed
+
+DEFAULT_TTL = 3600
+
+def content_hash(services):
+    """服务列表的内容哈希 (与顺序无关)，用于判断节点数据是否真的变化"""
+    canonical = sorted(json.dumps(s, ensure_ascii=False, sort_keys=True) for s in services)
+    return hashlib.sha256("\n".join(canonical).encode('utf-8')).hexdigest()[:16]
+
+def load_cache(cache_file):
+    """
+    读取按节点拆分的缓存: {server_name: {fetched_at, hash, ttl, services}}
+    兼容旧版的扁平列表格式 (视为已过期，仅在抓取失败时兜底)
+    """
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"[!] 读取缓存失败: {e}")
+        return {}
+
+    if isinstance(data, list):
+        cache = {}
+        for s in data:
+            entry = cache.setdefault(s.get('server_name', '未命名Lucky'), {"fetched_at": 0, "ttl": 0, "services": []})
+            entry["services"].append(s)
+        for entry in cache.values():
+            entry["hash"] = content_hash(entry["services"])
+        return cache
+    return data.get("servers", {}) if isinstance(data, dict) else {}
+
+def save_cache(cache_file, cache):
+    try:
+        changed, _ = write_if_changed(cache_file, dumps_compact({"servers": cache}), mode=0o600)
+        if changed:
+            print(f"[+] Lucky 数据已缓存至 {cache_file}")
+    except Exception as e:
+        print(f"[!] 保存缓存失败: {e}")
+
+def is_fresh(entry, now=None):
+    if not entry:
+        return False
+    now = now if now is not None else time.time()
+    return now - entry.get("fetched_at", 0) < entry.get("ttl", DEFAULT_TTL)
+
+def plan_refresh(lucky_servers, cache, refresh_names=(), prefer_cache=False):
+    """
+    决定哪些节点需要重新抓取:
+    - refresh_names 中点名的节点 ("all" 表示全部) 总是重新抓取
+    - prefer_cache (skiplucky) 时只要有缓存就使用，忽略 TTL
+    - 其余节点缓存过期或缺失时重新抓取
+    返回 (to_fetch, from_cache) 两个节点配置列表
+    """
+    refresh_names = set(refresh_names)
+    to_fetch, from_cache = [], []
+    for ls in lucky_servers:
+        name = ls.get("name", "未命名Lucky")
+        entry = cache.get(name)
+        if "all" in refresh_names or name in refresh_names:
+            to_fetch.append(ls)
+        elif entry and (prefer_cache or is_fresh(entry)):
+            from_cache.append(ls)
+        else:
+            to_fetch.append(ls)
+    return to_fetch, from_cache
+
+def update_entry(cache, server_name, services, ttl=DEFAULT_TTL):
+    """
+    用新抓取的数据更新节点缓存，返回 "changed" / "unchanged"。
+    只应在抓取成功时调用 (失败由调用方根据 error 保留旧数据)；空列表表示节点上的规则确实被删光，同样写入缓存
+    """
+    old = cache.get(server_name)
+    new_hash = content_hash(services)
+    cache[server_name] = {
+        "fetched_at": time.time(),
+        "hash": new_hash,
+        "ttl": ttl,
+        "services": services
+    }
+    return "unchanged" if old and old.get("hash") == new_hash else "changed"
+
+def collect_services(lucky_servers, cache):
+    """按配置中的节点顺序汇总所有缓存中的服务"""
+    services = []
+    for ls in lucky_servers:
+        entry = cache.get(ls.get("name", "未命名Lucky"))
+        if entry:
+            services.extend(entry.get("services", []))
+    return services
@@ -1,193 +1,491 @@
 import asyncio
+import functools
+import json
+import os
+import re
+import time
 from playwright.async_api import async_playwright
 
-async def get_lucky_services(url, username, password, server_name="lucky"):
-    services = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            viewport={'width': 1280, 'height': 720},
-            ignore_https_errors=True
-        )
-        page = await context.new_page()
+from lucky_api import LuckyApiError, create_session, get_lucky_services_api
+from output_writer import write_if_changed
 
-        # 确定目标 Web 服务页面的 URL
-        lucky_web_url = url.rstrip('/') + "/#/web"
-        print(f"[*] {server_name} 正在尝试访问: {lucky_web_url}")
-        
-        try:
-            # 增加超时并使用 networkidle2 的替代逻辑：等待基础 DOM 加载
-            await page.goto(lucky_web_url, wait_until="load", timeout=30000)
-            # 给页面 2 秒时间渲染基础框架
-            await page.wait_for_timeout(2000)
-        except Exception as e:
-            print(f"[!] {server_name} 初步访问异常: {e}")
+class LuckyScrapeError(Exception):
+    """浏览器抓取失败 (登录失败 / 规则行提取失败)，调用方应保留该节点上一次的有效数据"""
+    pass
+
+# 规则数据接口 (前端通过 XHR 拉取)，事件模式下以它的响应作为“数据已到达”的信号
+RULES_XHR_MARK = "/api/webservice"
+# 用于判断规则行数量是否已稳定的选择器
+ROW_STABLE_SELECTOR = '.el-table__row, .rule-item, .web-rule-item, div.rule-row, .el-card__body'
+
+async def _settle(page, wait_mode, fixed_ms, timeout=10000):
+    """fixed 模式固定等待；event 模式等待网络空闲"""
+    if wait_mode != "event":
+        await page.wait_for_timeout(fixed_ms)
+        return
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout)
+    except Exception:
+        pass
 
-        # 1. 自动判断当前状态：是登录页还是主界面？
-        # 等待密码框 (登录) 或 侧边栏 (主界面) 其中之一出现
-        print(f"[*] {server_name} 正在检测页面状态...")
+async def _wait_rows_stable(page, timeout=8000, interval=0.15, stable_rounds=3, loaded=None):
+    """
+    轮询规则行数量，连续 stable_rounds 次不变即认为渲染完成，返回最终行数
+    loaded: 规则接口已响应的事件；响应之后 0 行同样视为稳定 (节点没有规则，或布局只能靠兜底选择器匹配)
+    """
+    deadline = time.perf_counter() + timeout / 1000
+    last, stable = -1, 0
+    while time.perf_counter() < deadline:
         try:
-            await page.wait_for_selector('input[type="password"], .el-aside, .main-container, .base-layout', timeout=15000)
-        except:
-            print(f"[!] {server_name} 页面加载后未检测到已知特征，尝试强行继续")
+            count = await page.locator(ROW_STABLE_SELECTOR).count()
+        except Exception:
+            count = -1
+        settled = count > 0 or (count == 0 and loaded is not None and loaded.is_set())
+        if count == last and settled:
+            stable += 1
+            if stable >= stable_rounds:
+                return count
+        else:
+            stable = 0
+        last = count
+        await asyncio.sleep(interval)
+    return last
 
-        is_login_required = await page.query_selector('input[type="password"]') or "/login" in page.url
-        
-        if is_login_required:
-            print(f"[*] {server_name} 检测到需要登录...")
-            try:
-                # 寻找输入框
-                user_input = await page.wait_for_selector('input[type="text"], input[placeholder*="用户"], .el-input__inner', timeout=5000)
-                pass_input = await page.query_selector('input[type="password"]')
-                
-                if user_input and pass_input:
-                    await user_input.fill(username)
-                    await pass_input.fill(password)
-                    
-                    login_btn = await page.query_selector('button.login-button, button.el-button--primary, button:has-text("登录")')
-                    if login_btn:
-                        await login_btn.click()
-                        print(f"[*] {server_name} 已提交登录表单")
-                        
-                        # 等待主界面加载
-                        await page.wait_for_selector('.el-aside, .main-container, .base-layout', timeout=20000)
-                        print(f"[+] {server_name} 登录成功")
-                        
-                        # 重定向到目标页面 (Hash 路由有时需要二次确认)
-                        if "/web" not in page.url:
-                            print(f"[*] {server_name} 强制跳转到 Web 服务配置...")
-                            await page.goto(lucky_web_url, wait_until="domcontentloaded")
-            except Exception as e:
-                print(f"[!] {server_name} 登录操作失败: {e}")
-                await page.screenshot(path=f"debug_{server_name}_login_error.png")
+# 候选规则行选择器，按优先级排列；"text:" 前缀表示“包含该文本的 div”
+ROW_SELECTORS = [
+    '.el-table__row',
+    '.rule-item',
+    '.web-rule-item',
+    'div.rule-row',
+    '.el-card__body', # 针对卡片式布局
+    'text:➔',
+    'text:->'
+]
 
-        # 2. 确保在目标页并等待条目加载
-        if "/web" not in page.url:
-             await page.goto(lucky_web_url, wait_until="load")
-             await page.wait_for_timeout(3000)
+# 在页面内按优先级尝试选择器，命中 (>1 行) 后一次性返回所有行文本；都不命中则地毯式扫描 .el-main div
+EXTRACT_ROWS_JS = """
+(selectors) => {
+    const pick = (sel) => {
+        if (sel.startsWith('text:')) {
+            const needle = sel.slice(5);
+            return Array.from(document.querySelectorAll('div')).filter(d => (d.innerText || '').includes(needle));
+        }
+        try { return Array.from(document.querySelectorAll(sel)); } catch (e) { return []; }
+    };
+    for (const sel of selectors) {
+        const found = pick(sel);
+        if (found.length > 1) return { selector: sel, texts: found.map(el => el.innerText || '') };
+    }
+    const rows = Array.from(document.querySelectorAll('.el-main div'));
+    return { selector: null, texts: rows.map(el => el.innerText || '') };
+}
+"""
 
-        # 4. 等待渲染并展开子规则 (关键：许多服务隐藏在子规则中)
-        print(f"[*] {server_name} 正在准备数据展开...")
+def parse_rule_texts(texts):
+    """
+    从规则行文本中解析出 {domain, protocol, internal_addr} 记录
+    (纯函数，不访问页面)
+    """
+    unique_services = {}
+    for text in texts:
         try:
-            # 等待基本的 Web 规则界面特征
-            await page.wait_for_selector('.el-main, .main-container', timeout=15000)
+            if not text.strip() or '添加Web' in text or '显示所有' in text: continue
+
+            # 1. 提取前端域名和后端地址
+            # 策略：优先通过分割符判定逻辑关系 (源 ➔ 目标)
+            src = None
+            target = None
             
-            # 找到所有的“显示所有子规则”按钮并点击
-            expand_btns = await page.query_selector_all('button:has-text("显示所有子规则"), .el-button:has-text("显示")')
-            if expand_btns:
-                print(f"[*] {server_name} 发现 {len(expand_btns)} 处可展开的子规则，正在展开...")
-                for btn in expand_btns:
-                    try:
-                        await btn.click()
-                        await page.wait_for_timeout(500)
-                    except: pass
+            # 常见的 Lucky 分隔符
+            separators = ['➔', '->']
+            found_sep = next((s for s in separators if s in text), None)
             
-            # 给 5 秒让所有内容（包括子规则）加载完毕
-            await page.wait_for_timeout(5000)
+            if found_sep:
+                s_parts = text.split(found_sep)
+                left_text = s_parts[0].strip()
+                right_text = s_parts[1].strip()
+                
+                # 后端目标：通常是分隔符右侧的第一块文本或 URL
+                # 允许纯文字，例如 "文件服务"
+                target = right_text.split('\n')[0].split('|')[0].strip()
+                
+                # 前端域名：在分隔符左侧寻找最像域名的片段
+                # 我们过滤出所有符合地址特征的，取最后一个作为主域名
+                left_tokens = [t.strip() for t in re.split(r'\s+|\|', left_text) if len(t.strip()) > 2]
+                addr_tokens = [t for t in left_tokens if '.' in t or '://' in t or 'localhost' in t]
+                src = addr_tokens[-1] if addr_tokens else (left_tokens[-1] if left_tokens else "")
+            else:
+                # 兜底方案：正则提取所有地址并一头一尾匹配
+                pattern = r'https?://[^\s\t\n]+|[\w\.-]+\.[a-zA-Z]{2,}(?::\d+)?|127\.0\.0\.1:\d+|localhost:\d+'
+                found_parts = re.findall(pattern, text)
+                found_parts = [p.strip().rstrip(':').rstrip('.') for p in found_parts if len(p.strip()) > 3]
+                
+                if len(found_parts) >= 2:
+                    src = found_parts[0]
+                    target = found_parts[-1]
+                elif len(found_parts) == 1:
+                    src = found_parts[0]
+                    # 尝试从之后的文本中寻找后端描述
+                    after_src = text.split(src)[-1].strip()
+                    target = after_src.split('\n')[0].split('|')[0].strip()
+            
+            if src and target and target.strip():
+                domain_part = src.split('://')[-1].split('/')[0] if '://' in src else src
+                # 过滤掉常见的系统占位符
+                if domain_part in ['127.0.0.1', 'localhost', '0.0.0.0', '::']:
+                    # 如果能拿到更多信息则尝试更正 (在 found_parts 场景下)
+                    pass 
+
+                if domain_part and ('.' in domain_part or 'localhost' in domain_part or len(domain_part) > 3):
+                    if domain_part not in unique_services:
+                        unique_services[domain_part] = {
+                            "domain": domain_part,
+                            "protocol": "https" if "https://" in src else "http",
+                            "internal_addr": target.strip()
+                        }
         except:
-             print(f"[!] {server_name} 展开子规则阶段超时，尝试继续抓取")
-
-        # 5. 寻找规则行 - 采用更具包容性的策略
-        # 我们寻找包含协议、箭头、或“日志/操作”按钮的区块
-        # 很多时候最小容器是带有特定 class 的 div
-        rows = []
-        selectors = [
-            '.el-table__row', 
-            '.rule-item', 
-            '.web-rule-item',
-            'div.rule-row', 
-            '.el-card__body', # 针对卡片式布局
-            'div:has-text("➔")',
-            'div:has-text("->")'
-        ]
-        
-        for sel in selectors:
-            try:
-                found = await page.query_selector_all(sel)
-                if len(found) > 1:
-                    rows = found
-                    print(f"[*] {server_name} 使用选择器: {sel} (候选行: {len(rows)})")
-                    break
-            except: continue
+            continue
+
+    return list(unique_services.values())
 
-        if not rows:
-            print(f"[*] {server_name} 使用地毯式 div 扫描")
-            rows = await page.query_selector_all('.el-main div')
+async def _scrape_page(page, url, username, password, server_name, wait_mode="event", auth=None):
+    """auth: 可选的字典，回填本次是否触发了登录 (login_required) 以及登录是否成功 (login_ok)"""
+    services = []
+    auth = auth if auth is not None else {}
+    timings = {"login": 0.0, "navigate": 0.0, "expand": 0.0, "extract": 0.0}
+    mark = [time.perf_counter()]
 
-        unique_services = {}
-        import re
+    def lap(phase):
+        now = time.perf_counter()
+        timings[phase] += now - mark[0]
+        mark[0] = now
 
-        for idx, row in enumerate(rows):
-            try:
-                text = await row.inner_text()
-                if not text.strip() or '添加Web' in text or '显示所有' in text: continue
+    # 事件模式：监听规则接口的 XHR 响应
+    rules_loaded = asyncio.Event()
+    if wait_mode == "event":
+        page.on("response", lambda r: rules_loaded.set() if RULES_XHR_MARK in r.url else None)
 
-                # 1. 提取前端域名和后端地址
-                # 策略：优先通过分割符判定逻辑关系 (源 ➔ 目标)
-                src = None
-                target = None
-                
-                # 常见的 Lucky 分隔符
-                separators = ['➔', '->']
-                found_sep = next((s for s in separators if s in text), None)
+    # 确定目标 Web 服务页面的 URL
+    lucky_web_url = url.rstrip('/') + "/#/web"
+    print(f"[*] {server_name} 正在尝试访问: {lucky_web_url}")
+    
+    try:
+        # 增加超时并使用 networkidle2 的替代逻辑：等待基础 DOM 加载
+        await page.goto(lucky_web_url, wait_until="load", timeout=30000)
+        # fixed 模式给页面 2 秒时间渲染基础框架；event 模式等待网络空闲
+        await _settle(page, wait_mode, 2000)
+    except Exception as e:
+        print(f"[!] {server_name} 初步访问异常: {e}")
+
+    # 1. 自动判断当前状态：是登录页还是主界面？
+    # 等待密码框 (登录) 或 侧边栏 (主界面) 其中之一出现
+    print(f"[*] {server_name} 正在检测页面状态...")
+    try:
+        await page.wait_for_selector('input[type="password"], .el-aside, .main-container, .base-layout', timeout=15000)
+    except:
+        print(f"[!] {server_name} 页面加载后未检测到已知特征，尝试强行继续")
+
+    is_login_required = await page.query_selector('input[type="password"]') or "/login" in page.url
+    auth["login_required"] = bool(is_login_required)
+    lap("navigate")
+    
+    if is_login_required:
+        print(f"[*] {server_name} 检测到需要登录...")
+        try:
+            # 寻找输入框
+            user_input = await page.wait_for_selector('input[type="text"], input[placeholder*="用户"], .el-input__inner', timeout=5000)
+            pass_input = await page.query_selector('input[type="password"]')
+            
+            if user_input and pass_input:
+                await user_input.fill(username)
+                await pass_input.fill(password)
                 
-                if found_sep:
-                    s_parts = text.split(found_sep)
-                    left_text = s_parts[0].strip()
-                    right_text = s_parts[1].strip()
+                login_btn = await page.query_selector('button.login-button, button.el-button--primary, button:has-text("登录")')
+                if login_btn:
+                    await login_btn.click()
+                    print(f"[*] {server_name} 已提交登录表单")
                     
-                    # 后端目标：通常是分隔符右侧的第一块文本或 URL
-                    # 允许纯文字，例如 "文件服务"
-                    target = right_text.split('\n')[0].split('|')[0].strip()
+                    # 等待主界面加载
+                    await page.wait_for_selector('.el-aside, .main-container, .base-layout', timeout=20000)
+                    print(f"[+] {server_name} 登录成功")
+                    auth["login_ok"] = True
                     
-                    # 前端域名：在分隔符左侧寻找最像域名的片段
-                    # 我们过滤出所有符合地址特征的，取最后一个作为主域名
-                    left_tokens = [t.strip() for t in re.split(r'\s+|\|', left_text) if len(t.strip()) > 2]
-                    addr_tokens = [t for t in left_tokens if '.' in t or '://' in t or 'localhost' in t]
-                    src = addr_tokens[-1] if addr_tokens else (left_tokens[-1] if left_tokens else "")
-                else:
-                    # 兜底方案：正则提取所有地址并一头一尾匹配
-                    pattern = r'https?://[^\s\t\n]+|[\w\.-]+\.[a-zA-Z]{2,}(?::\d+)?|127\.0\.0\.1:\d+|localhost:\d+'
-                    found_parts = re.findall(pattern, text)
-                    found_parts = [p.strip().rstrip(':').rstrip('.') for p in found_parts if len(p.strip()) > 3]
-                    
-                    if len(found_parts) >= 2:
-                        src = found_parts[0]
-                        target = found_parts[-1]
-                    elif len(found_parts) == 1:
-                        src = found_parts[0]
-                        # 尝试从之后的文本中寻找后端描述
-                        after_src = text.split(src)[-1].strip()
-                        target = after_src.split('\n')[0].split('|')[0].strip()
-                
-                if src and target and target.strip():
-                    domain_part = src.split('://')[-1].split('/')[0] if '://' in src else src
-                    # 过滤掉常见的系统占位符
-                    if domain_part in ['127.0.0.1', 'localhost', '0.0.0.0', '::']:
-                        # 如果能拿到更多信息则尝试更正 (在 found_parts 场景下)
-                        pass 
-
-                    if domain_part and ('.' in domain_part or 'localhost' in domain_part or len(domain_part) > 3):
-                        if domain_part not in unique_services:
-                            unique_services[domain_part] = {
-                                "domain": domain_part,
-                                "protocol": "https" if "https://" in src else "http",
-                                "internal_addr": target.strip()
-                            }
-            except:
-                continue
-
-        services = list(unique_services.values())
-        print(f"[*] {server_name} 最终提取到 {len(services)} 条服务规则")
+                    # 重定向到目标页面 (Hash 路由有时需要二次确认)
+                    if "/web" not in page.url:
+                        print(f"[*] {server_name} 强制跳转到 Web 服务配置...")
+                        await page.goto(lucky_web_url, wait_until="domcontentloaded")
+        except Exception as e:
+            print(f"[!] {server_name} 登录操作失败: {e}")
+            await page.screenshot(path=f"debug_{server_name}_login_error.png")
+        lap("login")
+
+    # 2. 确保在目标页并等待条目加载
+    if "/web" not in page.url:
+         await page.goto(lucky_web_url, wait_until="load")
+         await _settle(page, wait_mode, 3000)
+    lap("navigate")
+
+    # 4. 等待渲染并展开子规则 (关键：许多服务隐藏在子规则中)
+    print(f"[*] {server_name} 正在准备数据展开...")
+    try:
+        # 等待基本的 Web 规则界面特征
+        await page.wait_for_selector('.el-main, .main-container', timeout=15000)
+        if wait_mode == "event":
+            # 等规则接口返回并渲染完成后再找展开按钮
+            try:
+                await asyncio.wait_for(rules_loaded.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            await _wait_rows_stable(page, loaded=rules_loaded)
         
-        if not services and server_name == "bwg-lucky":
-            # 如果依然抓不到且是重点服务器，记录部分 HTML 结构
-            page_content = await page.inner_text('.el-main')
-            print(f"DEBUG {server_name} .el-main 文本预览: {page_content[:200]}...")
+        # 找到所有的“显示所有子规则”按钮并点击
+        expand_btns = await page.query_selector_all('button:has-text("显示所有子规则"), .el-button:has-text("显示")')
+        if expand_btns:
+            print(f"[*] {server_name} 发现 {len(expand_btns)} 处可展开的子规则，正在展开...")
+            for btn in expand_btns:
+                try:
+                    await btn.click()
+                    if wait_mode != "event":
+                        await page.wait_for_timeout(500)
+                except: pass
+        
+        if wait_mode == "event":
+            # 子规则展开后等待网络空闲且行数稳定；没有可展开的按钮时行数已在上面确认稳定
+            if expand_btns:
+                await _settle(page, wait_mode, 0, timeout=5000)
+                await _wait_rows_stable(page, loaded=rules_loaded)
+        else:
+            # 给 5 秒让所有内容（包括子规则）加载完毕
+            await page.wait_for_timeout(5000)
+    except:
+         print(f"[!] {server_name} 展开子规则阶段超时，尝试继续抓取")
+    lap("expand")
+
+    # 5. 寻找规则行 - 采用更具包容性的策略
+    # 我们寻找包含协议、箭头、或“日志/操作”按钮的区块
+    # 很多时候最小容器是带有特定 class 的 div
+    # 选择器探测与文本提取在一次 page.evaluate 中完成，无论 DOM 多大都只有一次往返
+    texts = []
+    try:
+        result = await page.evaluate(EXTRACT_ROWS_JS, ROW_SELECTORS)
+        texts = result.get("texts", [])
+        if result.get("selector"):
+            print(f"[*] {server_name} 使用选择器: {result['selector']} (候选行: {len(texts)})")
+        else:
+            print(f"[*] {server_name} 使用地毯式 div 扫描 (候选行: {len(texts)})")
+    except Exception as e:
+        raise LuckyScrapeError(f"规则行提取失败: {e}") from e
+
+    services = parse_rule_texts(texts)
+
+    lap("extract")
+    print(f"[*] {server_name} 最终提取到 {len(services)} 条服务规则")
+    print(f"[*] {server_name} 耗时明细 ({wait_mode}): " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    
+    if not services and server_name == "bwg-lucky":
+        # 如果依然抓不到且是重点服务器，记录部分 HTML 结构
+        page_content = await page.inner_text('.el-main')
+        print(f"DEBUG {server_name} .el-main 文本预览: {page_content[:200]}...")
 
-        await browser.close()
     return services
 
+def _session_path(state_dir, server_name):
+    safe_name = re.sub(r'[^\w.-]', '_', server_name)
+    return os.path.join(state_dir, f"{safe_name}.json")
+
+def load_session_state(state_dir, server_name):
+    """读取节点保存的登录态 (cookies / localStorage)，过期或损坏时返回 None"""
+    if not state_dir:
+        return None
+    path = _session_path(state_dir, server_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get("expires_at", 0) <= time.time():
+            print(f"[*] {server_name} 保存的会话已过期")
+            invalidate_session_state(state_dir, server_name)
+            return None
+        return saved.get("storage_state")
+    except Exception as e:
+        print(f"[!] {server_name} 读取会话文件失败: {e}")
+        return None
+
+def save_session_state(state_dir, server_name, storage_state, ttl):
+    if not state_dir:
+        return
+    try:
+        # 登录态包含会话 cookie / token，目录与文件只允许当前用户访问
+        os.makedirs(state_dir, mode=0o700, exist_ok=True)
+        os.chmod(state_dir, 0o700)
+        now = time.time()
+        data = json.dumps({"saved_at": now, "expires_at": now + ttl, "storage_state": storage_state}, ensure_ascii=False)
+        write_if_changed(_session_path(state_dir, server_name), data, mode=0o600)
+        print(f"[+] {server_name} 登录态已保存")
+    except Exception as e:
+        print(f"[!] {server_name} 保存会话文件失败: {e}")
+
+def invalidate_session_state(state_dir, server_name):
+    if not state_dir:
+        return
+    try:
+        os.remove(_session_path(state_dir, server_name))
+    except OSError:
+        pass
+
+async def get_lucky_services(url, username, password, server_name="lucky", browser=None, wait_mode="event",
+                             state_dir=None, session_ttl=43200):
+    """
+    抓取单个 Lucky 节点的 Web 规则。
+    传入 browser 时复用该 Chromium 实例，仅为本节点新建一个独立的 context；
+    否则自行启动并关闭一个浏览器 (兼容旧的单独调用方式)。
+    wait_mode: "event" 等待网络空闲 / 规则接口响应 / 行数稳定；"fixed" 使用旧的固定等待
+    state_dir: 登录态保存目录，下次运行直接复用，仅在会话被拒绝时才重新登录
+    登录失败或规则行提取失败时抛出 LuckyScrapeError，而不是返回空列表
+    """
+    if browser is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                return await get_lucky_services(url, username, password, server_name, browser, wait_mode,
+                                                state_dir, session_ttl)
+            finally:
+                await browser.close()
+
+    storage_state = load_session_state(state_dir, server_name)
+    if storage_state:
+        print(f"[*] {server_name} 复用已保存的登录态")
+
+    # 每个节点使用独立的 context，cookie / localStorage 互不干扰
+    context = await browser.new_context(
+        viewport={'width': 1280, 'height': 720},
+        ignore_https_errors=True,
+        storage_state=storage_state
+    )
+    try:
+        page = await context.new_page()
+        auth = {}
+        services = await _scrape_page(page, url, username, password, server_name, wait_mode, auth)
+        if auth.get("login_required"):
+            if storage_state:
+                print(f"[*] {server_name} 保存的会话已被拒绝")
+            if auth.get("login_ok"):
+                save_session_state(state_dir, server_name, await context.storage_state(), session_ttl)
+            else:
+                # 鉴权失败，作废旧会话，避免下次继续使用；此时页面上没有规则，不能当作空结果返回
+                invalidate_session_state(state_dir, server_name)
+                raise LuckyScrapeError("登录失败 (账号密码错误或登录页已变化)")
+        return services
+    finally:
+        await context.close()
+
+class LuckyScrapeEngine:
+    """
+    Lucky 抓取引擎：优先走 REST API (共享一个带连接池的 Session)，
+    API 不可用时才回退到浏览器抓取，所有节点共享同一个 Chromium 实例。
+    在 max_concurrent 限制下并发抓取，记录每个节点的耗时
+    """
+    def __init__(self, max_concurrent=3, use_api=True, wait_mode="event", state_dir=None, session_ttl=43200):
+        self.max_concurrent = max(1, int(max_concurrent or 1))
+        self.use_api = use_api
+        self.wait_mode = wait_mode
+        self.state_dir = state_dir
+        self.session_ttl = session_ttl
+        self.session = create_session(pool_size=self.max_concurrent) if use_api else None
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def get_browser(self):
+        """按需启动共享浏览器 (只启动一次)"""
+        async with self._lock:
+            if self._browser is None:
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                print("[*] 已启动共享 Chromium 实例")
+            return self._browser
+
+    async def close(self):
+        if self.session is not None:
+            self.session.close()
+        if self._browser is not None:
+            try: await self._browser.close()
+            except Exception: pass
+            self._browser = None
+        if self._playwright is not None:
+            try: await self._playwright.stop()
+            except Exception: pass
+            self._playwright = None
+
+    async def scrape_server(self, ls_config, semaphore=None):
+        """
+        抓取单个节点，返回结果字典:
+        {"name", "services", "elapsed", "error"}
+        """
+        server_name = ls_config.get("name", "未命名Lucky")
+        semaphore = semaphore or asyncio.Semaphore(1)
+        async with semaphore:
+            print(f"[*] 正在从 Lucky ({server_name} - {ls_config['url']}) 获取服务信息...")
+            started = time.perf_counter()
+            services, error, source = [], None, "api"
+            try:
+                services = None
+                if self.use_api:
+                    try:
+                        loop = asyncio.get_running_loop()
+                        services = await loop.run_in_executor(None, functools.partial(
+                            get_lucky_services_api, ls_config['url'], ls_config['user'], ls_config['pass'],
+                            server_name, self.session))
+                    except LuckyApiError as e:
+                        print(f"[!] {server_name} API 不可用 ({e})，回退到浏览器抓取")
+                if services is None:
+                    source = "browser"
+                    browser = await self.get_browser()
+                    services = await get_lucky_services(ls_config['url'], ls_config['user'], ls_config['pass'], server_name, browser,
+                                                        self.wait_mode, self.state_dir, self.session_ttl)
+                # 给每个service打上服务器标记
+                for s in services:
+                    s['server_name'] = server_name
+            except Exception as e:
+                services, error = [], str(e)
+                print(f"[!] 从 {server_name} 获取数据失败: {e}")
+            elapsed = time.perf_counter() - started
+            print(f"[+] {server_name} 抓取结束 ({source}): {len(services)} 条规则, 耗时 {elapsed:.1f}s")
+            return {"name": server_name, "services": services, "elapsed": elapsed, "error": error, "source": source}
+
+    async def scrape_all(self, lucky_servers):
+        """并发抓取所有节点，结果顺序与 lucky_servers 保持一致"""
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        return await asyncio.gather(*(self.scrape_server(ls, semaphore) for ls in lucky_servers))
+
+    async def scrape_iter(self, lucky_servers):
+        """并发抓取所有节点，按完成顺序逐个产出 (ls_config, 结果)，先返回的节点可以先被处理"""
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def run(ls):
+            return ls, await self.scrape_server(ls, semaphore)
+
+        for fut in asyncio.as_completed([run(ls) for ls in lucky_servers]):
+            yield await fut
+
+def print_scrape_summary(results):
+    """打印每个节点的抓取耗时汇总"""
+    if not results:
+        return
+    print("\n=== Lucky 抓取耗时汇总 ===")
+    for r in results:
+        status = "失败" if r.get("error") else f"{len(r['services'])} 条, {r.get('source', 'browser')}"
+        print(f"  - {r['name']}: {r['elapsed']:.1f}s ({status})")
+    print("==========================\n")
+
+
 if __name__ == "__main__":
     # Test
     # services = asyncio.run(get_lucky_services("https://lucky.example.com", "admin", "password"))
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_NAME = "manifest.json"
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def dumps_compact(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def _file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return content_digest(f.read())
+    except OSError:
+        return None
+
+def _ensure_mode(path, mode):
+    try:
+        if os.stat(path).st_mode & 0o777 != mode:
+            os.chmod(path, mode)
+    except OSError:
+        pass
+
+def write_if_changed(path, data, mode=0o644):
+    """
+    内容与现有文件一致时不写；否则先写同目录临时文件再 os.replace 原子替换，
+    读取方 (nginx / 浏览器) 永远不会读到写了一半的文件
+    data 为 str 时按 UTF-8 编码。mode 为文件权限，含凭据的文件传 0o600 (内容未变化时也会修正权限)
+    返回 (是否写入, sha256)
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    digest = content_digest(data)
+    if _file_digest(path) == digest:
+        _ensure_mode(path, mode)
+        return False, digest
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp 创建的文件权限为 0600，输出文件改成常规权限以便 web 服务器读取
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    return True, digest
+
+class OutputWriter:
+    """
+    输出目录写入器
+    - 所有文件经 write_if_changed 原子写入，未变化的文件保持原样 (mtime 不变，ETag / 304 继续有效)
+    - 记录每个文件的 sha256，save_manifest() 写出 manifest.json 供缓存失效 (cache-busting) 使用
+    """
+    def __init__(self, output_dir, manifest_name=MANIFEST_NAME):
+        self.output_dir = output_dir
+        self.manifest_path = os.path.join(output_dir, manifest_name)
+        self.files = {}
+        self.written = []
+        self.unchanged = []
+        self.removed = []
+
+    def write(self, name, data):
+        """name 为相对 output_dir 的路径，返回是否实际写入"""
+        changed, digest = write_if_changed(os.path.join(self.output_dir, name), data)
+        self.files[name] = digest
+        (self.written if changed else self.unchanged).append(name)
+        return changed
+
+    def write_json(self, name, obj):
+        return self.write(name, dumps_compact(obj))
+
+    def remove(self, name):
+        """删除本次不再生成的旧文件 (例如切换输出模式后残留的预压缩版本)，返回是否实际删除"""
+        self.files.pop(name, None)
+        try:
+            os.remove(os.path.join(self.output_dir, name))
+        except FileNotFoundError:
+            return False
+        self.removed.append(name)
+        return True
+
+    def save_manifest(self):
+        # 不带时间戳：内容没变时清单本身也不变
+        manifest = {"files": {name: {"sha256": digest, "v": digest[:8]} for name, digest in sorted(self.files.items())}}
+        write_if_changed(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True))
+
+    def print_summary(self):
+        if self.written:
+            print(f"[+] 已更新 {len(self.written)} 个输出文件: {', '.join(self.written)}")
+        if self.unchanged:
+            print(f"[*] {len(self.unchanged)} 个输出文件内容未变化，跳过写入")
+        if self.removed:
+            print(f"[+] 已删除 {len(self.removed)} 个过期的输出文件: {', '.join(self.removed)}")
+
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+def write_compressed(writer, name, data):
+    """
+    写出预压缩版本 (.gz，以及安装了 brotli 时的 .br)，供 nginx gzip_static / brotli_static 直接使用
+    未安装 brotli 时删除旧的 .br，避免 nginx 继续返回过期数据
+    """
+    # mtime=0 保证相同内容压缩结果逐字节一致，才能被 write_if_changed 识别为未变化
+    writer.write(name + '.gz', gzip.compress(data, 9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        writer.remove(name + '.br')
+        return
+    writer.write(name + '.br', brotli.compress(data))
+
+async def save_and_generate(output_payload, output_dir, icon_css="", output_mode="inline"):
+    """
+    output_mode:
+    - "inline": 数据以 JSON 字面量内嵌进 index.html (默认，单文件即可离线打开)
+    - "split": index.html 为不含数据的静态页面，数据写入紧凑的 services.json (附带预压缩版本)
+      和离线兜底用的 services.js；只有数据变化时页面本身不会失效
+    所有文件原子写入、内容未变化时跳过，并在 output_dir/manifest.json 中记录各文件哈希
+    """
+    writer = OutputWriter(output_dir)
+
+    if output_mode == "split":
+        payload = dict(output_payload, icon_css=icon_css) if icon_css else output_payload
+        data = dumps_compact(payload)
+        writer.write('services.json', data)
+        write_compressed(writer, 'services.json', data.encode('utf-8'))
+        writer.write('services.js', f"window.GOTLUCKY_DATA = {data};\n")
+    else:
+        writer.write_json('services.json', output_payload)
+        # 从 split 模式切换回来时，清理残留的预压缩版本与离线数据，避免被 gzip_static / brotli_static 优先返回
+        for suffix in COMPRESSED_SUFFIXES:
+            writer.remove('services.json' + suffix)
+        writer.remove('services.js')
+    print(f"[+] 数据已保存至 {os.path.join(output_dir, 'services.json')}")
+
+    # 生成 HTML
+    if os.path.exists('template.html'):
+        with open('template.html', 'r', encoding='utf-8') as f:
+            tmpl = f.read()
+
+        if output_mode == "split":
+            html_content = tmpl.replace("var dataSource = 'inline';", "var dataSource = 'split';")
+            label = "数据分离版"
+        else:
+            # 将数据填充到模板中
+            html_content = tmpl.replace('var services = [];', f'var services = {json.dumps(output_payload["services"], ensure_ascii=False)};')
+            # 增加 ip_aliases 填充
+            html_content = html_content.replace('var ipAliases = {};', f'var ipAliases = {json.dumps(output_payload["ip_aliases"], ensure_ascii=False)};')
+            # 增加 frp_mappings 填充
+            html_content = html_content.replace('var frp_mappings = [];', f'var frp_mappings = {json.dumps(output_payload["frp_mappings"], ensure_ascii=False)};')
+            # 增加 terminal_names 填充
+            html_content = html_content.replace('var terminalNames = {};', f'var terminalNames = {json.dumps(output_payload["terminal_names"], ensure_ascii=False)};')
+            # 雪碧图 CSS
+            if icon_css:
+                html_content = html_content.replace('/* __ICON_SPRITE_CSS__ */', icon_css)
+            label = "数据内嵌版"
+
+        writer.write('index.html', html_content)
+        print(f"[+] 导航页面 ({label}) 已生成: {os.path.join(output_dir, 'index.html')}")
+
+    writer.save_manifest()
+    writer.print_summary()
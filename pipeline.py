@@ -0,0 +1,460 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from cf_dns import fetch_all_cf_records, resolve_domain_with_cache, get_lucky_server_ip, get_cf_index
+from dns_resolver import get_resolver
+from favicon import FaviconFetcher, use_existing_icons
+from frp_admin import collect_frpc_admin, merge_mappings
+from icon_bundle import bundle_icons
+from lucky_cache import DEFAULT_TTL, load_cache, save_cache, plan_refresh, update_entry, collect_services
+from lucky_data import LuckyScrapeEngine, print_scrape_summary
+from output_writer import save_and_generate
+from resolver import ServiceResolver
+from scanner_frp import get_frp_configs, parse_frp_configs
+from static_mappings import StaticMappingMatcher
+
+
+class StageTimer:
+    """
+    按阶段记录耗时，用于输出每轮的耗时分解
+    阶段可以并发执行 (不同线程 / 协程)，因此同时记录自 reset 起的实际耗时 (wall)
+    """
+    def __init__(self):
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    def reset(self):
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    def print_summary(self, title="耗时分解"):
+        if not self.timings:
+            return
+        total = sum(self.timings.values())
+        wall = time.perf_counter() - self.started
+        parts = ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in self.timings.items())
+        print(f"[*] {title}: {parts} (阶段合计 {total:.2f}s，实际耗时 {wall:.2f}s)")
+
+
+# 图标字段由图标阶段填充，不参与数据哈希
+_ICON_FIELDS = ('icon', 'icon_sprite')
+
+def data_digest(final_data, frp_mappings, terminal_names, ip_aliases):
+    """整合结果的内容哈希 (不含图标字段)，用于判断是否需要重新生成页面"""
+    records = [{k: v for k, v in s.items() if k not in _ICON_FIELDS} for s in final_data]
+    canonical = json.dumps([records, frp_mappings, terminal_names, ip_aliases], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+class Pipeline:
+    """
+    生成流程的各个阶段及其共享状态 (配置、FRP 映射、Lucky 缓存、抓取引擎、图标下载器)
+    单次运行 (main.py) 按顺序调用一遍各阶段；常驻模式 (daemon.py) 在同一个实例上按各自的间隔重复调用，
+    keep_warm=True 时浏览器、HTTP 连接池等在多轮之间保持打开
+    """
+    def __init__(self, config, terminal_names=None, output_dir='myserv', cache_file='lucky_cache.json', keep_warm=False):
+        self.config = config
+        self.terminal_names = terminal_names or {}
+        self.output_dir = output_dir
+        self.favicons_dir = os.path.join(output_dir, 'favicons')
+        os.makedirs(self.favicons_dir, exist_ok=True)
+        self.keep_warm = keep_warm
+        self.timer = StageTimer()
+
+        self.cache_file = cache_file
+        self.lucky_cache = load_cache(cache_file)
+        self.frp_mappings = []
+        self.frp_version = 0
+        self.frp_config_paths = []
+        self.reload_config(config)
+        self._engine = None
+        self._fetcher = None
+        self._resolver = None
+        self._resolver_key = None
+
+    def reload_config(self, config):
+        """应用新的 config.json (常驻模式下热加载)；抓取引擎与图标下载器的参数在重启前保持不变"""
+        self.config = config
+        self.lucky_servers = config.get("lucky_servers", [])
+        # static_mappings 在加载配置时预编译一次
+        self.static_mappings = StaticMappingMatcher(config.get("static_mappings", []))
+        self.cache_ttl = config.get("lucky_cache_ttl", DEFAULT_TTL)
+
+    # ---- 1. FRP ----
+    def scan_frp(self):
+        with self.timer.stage("frp"):
+            systemd_dir = self.config.get("systemd_dir", "/lib/systemd/system")
+            print(f"[*] 正在扫描 FRP 服务 (目录: {systemd_dir})...")
+            frp_services = get_frp_configs(systemd_dir)
+            self.frp_config_paths = [s['config_path'] for s in frp_services]
+            # 未变化的配置直接命中解析缓存 (按路径 + mtime + size)
+            all_frp_mappings = parse_frp_configs(s['config_path'] for s in frp_services)
+            # 可选：查询各 frpc 的管理接口，以实时状态为准并标记代理是否在运行
+            admin_endpoints = self.config.get("frpc_admin", [])
+            if admin_endpoints:
+                admin_mappings = collect_frpc_admin(admin_endpoints, timeout=self.config.get("frpc_admin_timeout", 3))
+                all_frp_mappings = merge_mappings(all_frp_mappings, admin_mappings)
+            if all_frp_mappings != self.frp_mappings:
+                self.frp_version += 1
+            self.frp_mappings = all_frp_mappings
+            print(f"[+] 找到 {len(all_frp_mappings)} 个 FRP 映射")
+        return self.frp_mappings
+
+    # ---- 2. Lucky ----
+    def _new_engine(self):
+        return LuckyScrapeEngine(self.config.get("max_concurrent_scrapes", 3),
+                                 use_api=self.config.get("lucky_use_api", True),
+                                 wait_mode=self.config.get("lucky_wait_mode", "event"),
+                                 state_dir=self.config.get("lucky_state_dir", ".lucky_state"),
+                                 session_ttl=self.config.get("lucky_session_ttl", 43200))
+
+    def plan_lucky(self, refresh_names=(), prefer_cache=False):
+        """返回 (需要抓取的节点, 使用缓存的节点)，不做任何网络请求"""
+        return plan_refresh(self.lucky_servers, self.lucky_cache, refresh_names, prefer_cache=prefer_cache)
+
+    async def refresh_lucky(self, refresh_names=(), prefer_cache=False, on_server=None):
+        """
+        按节点缓存：只重新抓取过期 / 缺失 / 被点名的节点，返回汇总后的服务列表
+        on_server(节点名) 在每个节点的数据可用时立即调用 (缓存命中的节点最先，抓取的节点按完成顺序)
+        """
+        with self.timer.stage("lucky"):
+            to_fetch, from_cache = self.plan_lucky(refresh_names, prefer_cache)
+            fetched, kept, failed = [], [], []
+            if on_server:
+                for ls in from_cache:
+                    on_server(ls['name'])
+
+            if to_fetch:
+                # 所有节点共享一个 Chromium，按 max_concurrent_scrapes 并发抓取
+                print(f"[*] 正在并发抓取 {len(to_fetch)} 个 Lucky 节点 (并发上限: {self.config.get('max_concurrent_scrapes', 3)})...")
+                if self.keep_warm and self._engine is None:
+                    self._engine = self._new_engine()
+                engine = self._engine if self.keep_warm else self._new_engine()
+                scrape_results = {}
+                try:
+                    async for ls_config, r in engine.scrape_iter(to_fetch):
+                        scrape_results[id(ls_config)] = r
+                        # 抓取失败时保留该节点上一次的有效数据
+                        if r['error']:
+                            (kept if r['name'] in self.lucky_cache else failed).append(r['name'])
+                        else:
+                            update_entry(self.lucky_cache, r['name'], r['services'], ls_config.get("cache_ttl", self.cache_ttl))
+                            fetched.append(r['name'])
+                        if on_server:
+                            on_server(r['name'])
+                finally:
+                    if not self.keep_warm:
+                        await engine.close()
+                print_scrape_summary([scrape_results[id(ls)] for ls in to_fetch])
+                save_cache(self.cache_file, self.lucky_cache)
+
+            lucky_services = collect_services(self.lucky_servers, self.lucky_cache)
+            print("[*] Lucky 数据来源汇总:")
+            print(f"  - 缓存命中: {', '.join(ls['name'] for ls in from_cache) or '无'}")
+            print(f"  - 重新抓取: {', '.join(fetched) or '无'}")
+            if kept:
+                print(f"  - 抓取失败，沿用旧数据: {', '.join(kept)}")
+            if failed:
+                print(f"  - 抓取失败且无缓存: {', '.join(failed)}")
+            print(f"[+] 总计找到 {len(lucky_services)} 个 Lucky 服务")
+        return lucky_services
+
+    # ---- 3. Cloudflare ----
+    def sync_cf(self, force=False, snapshot_ttl=None):
+        """snapshot_ttl 默认取 cloudflare.snapshot_ttl；传 0 表示忽略快照有效期，按 Zone 增量同步"""
+        cf_config = self.config.get("cloudflare", {})
+        with self.timer.stage("cf"):
+            # 本地快照未过期时不访问 API；force 强制全量同步
+            fetch_all_cf_records(cf_config.get("api_token"), max_workers=cf_config.get("max_workers", 4),
+                                 snapshot_file=cf_config.get("snapshot_file", "cf_snapshot.json"),
+                                 snapshot_ttl=cf_config.get("snapshot_ttl", 1800) if snapshot_ttl is None else snapshot_ttl,
+                                 force=force)
+
+    # ---- 并发采集 ----
+    def prefetch_hosts(self):
+        """提前解析 Lucky 服务器主机名，整合阶段直接命中 DNS 缓存"""
+        with self.timer.stage("dns-prefetch"):
+            hosts = {urlparse(ls_config['url']).hostname for ls_config in self.lucky_servers}
+            get_resolver().resolve_many({h for h in hosts if h})
+
+    async def gather_sources(self, refresh_names=(), prefer_cache=False, cf_force=False):
+        """
+        采集所有数据源，返回 Lucky 服务列表
+        FRP 扫描、CF 同步、DNS 预解析彼此独立，各自在线程中执行；Lucky 抓取在事件循环中并发进行，
+        全部完成后才进入整合。总耗时接近最慢的单个数据源而不是各阶段之和。
+        concurrent_stages 为 false 时按原来的顺序依次执行 (日志不交错，便于排查)
+        """
+        if not self.config.get("concurrent_stages", True):
+            self.scan_frp()
+            lucky_services = await self.refresh_lucky(refresh_names, prefer_cache)
+            self.sync_cf(force=cf_force)
+            return lucky_services
+        print("[*] 并发采集 FRP / Lucky / Cloudflare / DNS ...")
+        _, _, _, lucky_services = await asyncio.gather(
+            asyncio.to_thread(self.scan_frp),
+            asyncio.to_thread(self.sync_cf, cf_force),
+            asyncio.to_thread(self.prefetch_hosts),
+            self.refresh_lucky(refresh_names, prefer_cache),
+        )
+        return lucky_services
+
+    # ---- 4. DNS 预解析 + 整合 ----
+    def resolve_hosts(self, hosts):
+        """
+        一次性并发解析一批主机名 (CF 中能查到的跳过)，后续整合中的解析全部命中缓存。返回 {主机名: IP}
+        """
+        with self.timer.stage("dns"):
+            pending_hosts = {h for h in hosts if h and not resolve_domain_with_cache(h)}
+            if not pending_hosts:
+                return {}
+            started = time.perf_counter()
+            host_ips = get_resolver().resolve_many(pending_hosts)
+            print(f"[*] [DNS] 预解析 {len(pending_hosts)} 个主机名，耗时 {time.perf_counter() - started:.2f}s")
+        return host_ips
+
+    def lucky_server_ips(self):
+        lucky_server_ips = {}
+        for ls_config in self.lucky_servers:
+            my_ip = ls_config.get('myip')
+            resolved_ip = get_lucky_server_ip(ls_config['url'])
+            # 记录服务器 IP：如果有指定的 myip 则优先使用，否则用解析到的
+            lucky_server_ips[ls_config['name']] = my_ip if my_ip else (resolved_ip if resolved_ip else "未知")
+        return lucky_server_ips
+
+    def _base_hosts(self):
+        """Lucky 服务器与 FRP server_addr：构建 ServiceResolver 之前就需要解析"""
+        hosts = {urlparse(ls_config['url']).hostname for ls_config in self.lucky_servers}
+        hosts.update(fm.get('server_addr', '') for fm in self.frp_mappings)
+        return hosts
+
+    def _service_resolver(self, host_ips):
+        """
+        返回本轮使用的 ServiceResolver：FRP 映射、CF 记录与相关配置都没变时复用上一轮的实例
+        (FRP 索引与 CF 索引保持不变)，只替换 DNS 预解析结果；CF 索引直接取 cf_dns 维护的那一份
+        """
+        server_ips = self.lucky_server_ips()
+        cf_version, cf_exact, cf_wildcards = get_cf_index()
+        key = (self.frp_version, cf_version, id(self.static_mappings),
+               json.dumps([server_ips, self.config.get("ip_aliases", {})], sort_keys=True))
+        if self._resolver is not None and key == self._resolver_key:
+            self._resolver.reset(host_ips, server_ips)
+            # FRP server_addr 的 DNS 结果变化时同样需要重建
+            if not self._resolver.frp_index_stale():
+                return self._resolver
+        self._resolver = ServiceResolver(
+            self.frp_mappings,
+            server_ips,
+            static_mappings=self.static_mappings,
+            cf_index=(cf_exact, cf_wildcards),
+            host_ips=host_ips,
+            ip_aliases=self.config.get("ip_aliases", {})
+        )
+        self._resolver_key = key
+        return self._resolver
+
+    def resolve(self, lucky_services):
+        """整合数据 (纯计算，见 resolver.ServiceResolver)，返回最终记录列表"""
+        host_ips = self.resolve_hosts(self._base_hosts() | {ls['domain'].split(':')[0] for ls in lucky_services})
+        with self.timer.stage("resolve"):
+            print(f"[*] 正在整合数据并处理路径分析 (共 {len(lucky_services)} 个条目)...")
+            final_data = self._service_resolver(host_ips).resolve_all(lucky_services)
+        get_resolver().print_stats()
+        return final_data
+
+    def resolve_frp_delta(self, lucky_services, final_data, old_mappings):
+        """
+        FRP 映射变化后的增量整合：只重新溯源前端端口或后端端口落在变化映射端口上的服务，
+        原地替换 final_data 中对应的记录 (保留原有图标)。返回被替换的下标列表
+        """
+        def key(m):
+            return tuple(sorted((k, str(v)) for k, v in m.items()))
+        old_keys = {key(m) for m in old_mappings}
+        new_keys = {key(m) for m in self.frp_mappings}
+        ports = set()
+        for m in [m for m in old_mappings if key(m) not in new_keys] + [m for m in self.frp_mappings if key(m) not in old_keys]:
+            ports.update((str(m.get('local_port')), str(m.get('remote_port'))))
+
+        affected = [i for i, ls in enumerate(lucky_services) if ServiceResolver.frp_ports(ls) & ports]
+        if not affected:
+            return []
+        host_ips = self.resolve_hosts(self._base_hosts() | {lucky_services[i]['domain'].split(':')[0] for i in affected})
+        with self.timer.stage("resolve"):
+            service_resolver = self._service_resolver(host_ips)
+            service_resolver.index_services(lucky_services)
+            for i in affected:
+                record = service_resolver.resolve(lucky_services[i])
+                for field in _ICON_FIELDS:
+                    if field in final_data[i]:
+                        record[field] = final_data[i][field]
+                final_data[i] = record
+        return affected
+
+    def digest(self, final_data):
+        return data_digest(final_data, self.frp_mappings, self.terminal_names, self.config.get("ip_aliases", {}))
+
+    # ---- 5. 图标 ----
+    def _new_fetcher(self):
+        return FaviconFetcher(self.favicons_dir,
+                              max_workers=self.config.get("favicon_workers", 16),
+                              deadline=self.config.get("favicon_deadline", 15),
+                              revalidate_after=self.config.get("favicon_revalidate", 7 * 86400))
+
+    def fetch_icons(self, final_data, skip=False):
+        with self.timer.stage("favicon"):
+            if skip:
+                print("\n[*] 检测到 skipicon 参数，跳过图标获取步骤。")
+                use_existing_icons(final_data, self.favicons_dir)
+                return
+            print("\n[*] 正在处理图标下载与缓存...")
+            if self.keep_warm:
+                if self._fetcher is None:
+                    self._fetcher = self._new_fetcher()
+                self._fetcher.fetch_all(final_data)
+                return
+            fetcher = self._new_fetcher()
+            try:
+                fetcher.fetch_all(final_data)
+            finally:
+                fetcher.close()
+
+    # ---- 流式：采集 ➔ 整合 ➔ 图标 ----
+    async def stream(self, refresh_names=(), prefer_cache=False, cf_force=False, skip_icons=False):
+        """
+        流式执行采集、整合与图标下载，返回 (Lucky 服务列表, 最终记录列表)
+        - FRP / CF / DNS 预解析与 Lucky 抓取并发进行 (同 gather_sources)
+        - 每个 Lucky 节点的数据一到 (缓存命中或抓取完成) 就立即整合，不必等待最慢的节点
+        - 整合好的记录进入有界队列 (icon_queue_size)，由图标下载线程池边整合边消费
+        - 配置了 stun_route 的记录依赖其他节点的服务，延后到全部节点完成后再整合
+        最终记录按配置中的节点顺序排列，与一次性整合的结果一致
+        """
+        sources = asyncio.gather(
+            asyncio.to_thread(self.scan_frp),
+            asyncio.to_thread(self.sync_cf, cf_force),
+            asyncio.to_thread(self.prefetch_hosts),
+        )
+        ready_servers = asyncio.Queue()
+        icon_queue = asyncio.Queue(maxsize=max(1, self.config.get("icon_queue_size", 64)))
+        per_server = {}
+        service_resolver = None
+
+        fetcher = None
+        icon_task = None
+        if not skip_icons:
+            print("\n[*] 图标下载与整合同时进行...")
+            if self.keep_warm and self._fetcher is None:
+                self._fetcher = self._new_fetcher()
+            fetcher = self._fetcher if self.keep_warm else self._new_fetcher()
+            icon_task = asyncio.ensure_future(fetcher.fetch_queue(icon_queue))
+
+        async def put_icon(record):
+            """
+            放入图标队列。消费者 (icon_task) 异常退出后没人取队列，队列满时 put 会永远阻塞，
+            因此与 icon_task 一起等待：消费者先结束就抛出它的异常，让整个流程失败而不是挂起
+            """
+            if not icon_task.done():
+                put = asyncio.ensure_future(icon_queue.put(record))
+                await asyncio.wait({put, icon_task}, return_when=asyncio.FIRST_COMPLETED)
+                if put.done():
+                    return
+                put.cancel()
+            icon_task.result()
+            raise RuntimeError("图标下载任务已提前结束")
+
+        async def resolve_worker():
+            nonlocal service_resolver
+            # FRP 映射与 CF 记录是整合的前提
+            await sources
+            service_resolver = self._service_resolver(await asyncio.to_thread(self.resolve_hosts, self._base_hosts()))
+            while True:
+                name = await ready_servers.get()
+                if name is None:
+                    return
+                services = (self.lucky_cache.get(name) or {}).get("services", [])
+                host_ips = await asyncio.to_thread(self.resolve_hosts, {ls['domain'].split(':')[0] for ls in services})
+                service_resolver.host_ips.update(host_ips)
+                records, deferred = [], 0
+                with self.timer.stage("resolve"):
+                    for ls in services:
+                        if service_resolver.needs_full_index(ls):
+                            records.append(None)
+                            deferred += 1
+                        else:
+                            records.append(service_resolver.resolve(ls))
+                per_server[name] = records
+                print(f"[*] {name}: 已整合 {len(records) - deferred} 个条目" + (f"，{deferred} 个 STUN 条目延后" if deferred else ""))
+                if icon_task:
+                    for record in records:
+                        if record is not None:
+                            await put_icon(record)
+
+        worker = asyncio.ensure_future(resolve_worker())
+        try:
+            lucky_services = await self.refresh_lucky(refresh_names, prefer_cache, on_server=ready_servers.put_nowait)
+            ready_servers.put_nowait(None)
+            await worker
+
+            # 全部节点就绪：建立完整的 host 索引，整合延后的 STUN 条目，并按节点顺序组装结果
+            service_resolver.index_services(lucky_services)
+            final_data = []
+            for ls_config in self.lucky_servers:
+                name = ls_config.get("name", "未命名Lucky")
+                services = (self.lucky_cache.get(name) or {}).get("services", [])
+                for ls, record in zip(services, per_server.get(name, [])):
+                    if record is None:
+                        record = service_resolver.resolve(ls)
+                        if icon_task:
+                            await put_icon(record)
+                    final_data.append(record)
+            get_resolver().print_stats()
+
+            if icon_task:
+                await put_icon(None)
+                # 只统计整合结束后仍在等待图标的时间，其余部分已与采集 / 整合重叠
+                with self.timer.stage("favicon-tail"):
+                    await icon_task
+            else:
+                print("\n[*] 检测到 skipicon 参数，跳过图标获取步骤。")
+                use_existing_icons(final_data, self.favicons_dir)
+        finally:
+            for task in (worker, icon_task):
+                if task and not task.done():
+                    task.cancel()
+            if fetcher is not None and not self.keep_warm:
+                fetcher.close()
+        return lucky_services, final_data
+
+    # ---- 6. 输出 ----
+    async def generate(self, final_data):
+        with self.timer.stage("output"):
+            # 打包会改写 icon 字段，在副本上进行，常驻模式下保留的记录可以反复生成
+            final_data = [dict(s) for s in final_data]
+            # 图标打包：内嵌 data URI 或合并为一张雪碧图，减少页面的图片请求
+            icon_css = bundle_icons(final_data, self.output_dir, self.config.get("icon_bundle", "none"))
+            output_payload = {
+                "ip_aliases": self.config.get("ip_aliases", {}),
+                "services": final_data,
+                "frp_mappings": self.frp_mappings,
+                "terminal_names": self.terminal_names
+            }
+            await save_and_generate(output_payload, self.output_dir, icon_css, self.config.get("output_mode", "inline"))
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.close()
+            self._engine = None
+        if self._fetcher is not None:
+            self._fetcher.close()
+            self._fetcher = None
@@ -0,0 +1,95 @@
+import io
+
+from output_writer import write_if_changed
+
+# 与 template.html 中 commentPalette 的 solid 颜色保持一致
+PALETTE = [
+    '#1a73e8',  # Blue
+    '#1e8e3e',  # Green
+    '#ff9800',  # Orange
+    '#d93025',  # Red
+    '#9c27b0',  # Purple
+    '#00bcd4',  # Cyan
+    '#e91e63',  # Pink
+    '#3f51b5',  # Indigo
+    '#795548',  # Brown
+    '#8bc34a',  # Light Green
+]
+FONT_CANDIDATES = ["msyh.ttc", "arial.ttf", "simhei.ttf", "DejaVuSans.ttf"]
+ICON_SIZE = (64, 64)
+
+def _to_int32(n):
+    n &= 0xFFFFFFFF
+    return n - 0x100000000 if n & 0x80000000 else n
+
+def js_string_hash(text):
+    """与 template.html 中 getColorForComment 的哈希算法逐位一致 (JS: hash = c + ((hash << 5) - hash))"""
+    h = 0
+    data = text.encode('utf-16-le')
+    # charCodeAt 按 UTF-16 码元计算
+    for i in range(0, len(data), 2):
+        code = data[i] | (data[i + 1] << 8)
+        h = code + (_to_int32(_to_int32(h) << 5) - h)
+    return h
+
+def color_for(text):
+    """按域名哈希确定性地选取背景色，与页面上的分类配色一致"""
+    return PALETTE[abs(js_string_hash(text)) % len(PALETTE)]
+
+class PlaceholderRenderer:
+    """
+    首字母占位图标渲染器
+    - 字体只加载一次
+    - 按 (字母, 颜色) 缓存渲染好的图块，同一批次内相同组合只渲染一次
+    - 颜色由域名哈希决定，输出可复现；与现有文件字节完全相同时不重写，否则原子替换
+    """
+    def __init__(self, size=ICON_SIZE):
+        self.size = size
+        self._font = None
+        self._tiles = {}
+
+    def _get_font(self):
+        if self._font is None:
+            from PIL import ImageFont
+            for f_name in FONT_CANDIDATES:
+                try:
+                    self._font = ImageFont.truetype(f_name, 40)
+                    break
+                except Exception:
+                    continue
+            if self._font is None:
+                self._font = ImageFont.load_default()
+        return self._font
+
+    def render(self, domain):
+        """返回该域名占位图标的 PNG 字节"""
+        first_char = domain[0].upper() if domain else "S"
+        color = color_for(domain or "S")
+        key = (first_char, color)
+        if key not in self._tiles:
+            from PIL import Image, ImageDraw
+            font = self._get_font()
+            img = Image.new('RGB', self.size, color=color)
+            draw = ImageDraw.Draw(img)
+            try: left, top, right, bottom = draw.textbbox((0, 0), first_char, font=font)
+            except Exception: right, bottom = draw.textsize(first_char, font=font); left, top = 0, 0
+            pos = ((self.size[0] - (right-left)) / 2, (self.size[1] - (bottom-top)) / 2 - 4)
+            draw.text(pos, first_char, fill="white", font=font)
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            self._tiles[key] = buf.getvalue()
+        return self._tiles[key]
+
+    def render_batch(self, items):
+        """
+        批量生成占位图标，items 为 [(domain, path), ...]
+        返回 (写入数, 未变化跳过数)
+        """
+        written = skipped = 0
+        for domain, path in items:
+            changed, _ = write_if_changed(path, self.render(domain))
+            if changed:
+                written += 1
+            else:
+                skipped += 1
+        return written, skipped
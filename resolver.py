@@ -0,0 +1,314 @@
+from cf_dns import build_cf_index, lookup_cf_index
+from frp_index import FrpIndex
+from static_mappings import StaticMappingMatcher
+from utils import get_mapping_type
+
+class ServiceResolver:
+    """
+    服务路径溯源引擎 (不做任何网络 / 文件 I/O)
+    输入均为事先准备好的数据：
+    - frp_mappings: scanner_frp.parse_frp_config 输出的映射列表 (或已构建好的 FrpIndex)
+    - server_ips: {Lucky 服务器名: 服务器 IP}
+    - static_mappings: config.json 中的 static_mappings (或已构建好的 StaticMappingMatcher)
+    - cf_records: Cloudflare A/AAAA 记录列表 ({name, content, proxied, type})；
+      也可以用 cf_index 直接传入已构建好的 (精确匹配字典, 泛域名 trie)
+    - host_ips: {主机名: IP}，系统 DNS 的预解析结果，缺失或为 None 视为 "Unknown"
+    - ip_aliases: config.json 中的 ip_aliases
+    resolve_all(services) 返回最终写入 services.json 的记录列表
+    """
+    def __init__(self, frp_mappings, server_ips, static_mappings=None, cf_records=None,
+                 host_ips=None, ip_aliases=None, verbose=True, cf_index=None):
+        self.server_ips = server_ips or {}
+        if isinstance(static_mappings, StaticMappingMatcher):
+            self.static_matcher = static_mappings
+        else:
+            self.static_matcher = StaticMappingMatcher(static_mappings)
+        self.host_ips = host_ips or {}
+        self.ip_aliases = ip_aliases or {}
+        self.verbose = verbose
+        self.services = []
+        self.services_by_host = {}
+        self._cf_exact, self._cf_wildcards = cf_index if cf_index is not None else build_cf_index(cf_records or [])
+        if isinstance(frp_mappings, FrpIndex):
+            self.frp_index = frp_mappings
+        else:
+            self.frp_index = FrpIndex(frp_mappings or [], self._resolve_frp_server)
+
+    def _log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def reset(self, host_ips=None, server_ips=None):
+        """复用已构建的 FRP / CF 索引开始新一轮整合：替换 DNS 预解析结果并清空上一轮的服务索引"""
+        self.host_ips = host_ips or {}
+        if server_ips is not None:
+            self.server_ips = server_ips
+        self.services = []
+        self.services_by_host = {}
+
+    def frp_index_stale(self):
+        """FRP server_addr 在当前 CF 记录 / DNS 结果下的解析是否与建索引时不同"""
+        return self.frp_index.stale(self._resolve_frp_server)
+
+    def lookup_cf(self, domain):
+        return lookup_cf_index(self._cf_exact, self._cf_wildcards, domain)
+
+    def lookup_ip(self, domain):
+        return self.host_ips.get(domain.lower()) or "Unknown"
+
+    def _resolve_frp_server(self, addr):
+        cf_rec = self.lookup_cf(addr)
+        return cf_rec['content'] if cf_rec else self.lookup_ip(addr)
+
+    def match_static(self, domain):
+        """返回第一条 pattern 匹配该域名的静态映射"""
+        return self.static_matcher.match(domain)
+
+    def needs_full_index(self, ls):
+        """配置了 stun_route 的服务要在其他节点的服务中查找 STUN 目标，只能在全部节点抓取完成后溯源"""
+        sm = self.match_static(ls['domain'].split(':')[0])
+        return bool(sm and "stun_route" in sm)
+
+    @staticmethod
+    def frp_ports(ls):
+        """该服务做 FRP 匹配时用到的端口 (前端端口 / Lucky 后端端口)，FRP 映射变化时据此判断是否需要重新溯源"""
+        raw_domain = ls['domain']
+        ports = {raw_domain.split(':')[1] if ':' in raw_domain else ("443" if ls.get("protocol") == "https" else "80")}
+        addr_clean = ls['internal_addr'].split('://')[-1].split('/')[0]
+        if ':' in addr_clean:
+            ports.add(addr_clean.split(':')[-1])
+        return ports
+
+    def index_services(self, services):
+        """记录全部 Lucky 服务，并建立 host ➔ 服务 的索引 (供 STUN 目标查找，同名保留第一条)"""
+        self.services = list(services)
+        self.services_by_host = {}
+        for ls in self.services:
+            # 重点：Lucky 原始 domain 可能包含端口，需要统一只比较 host
+            self.services_by_host.setdefault(ls['domain'].split(':')[0], ls)
+
+    def resolve_all(self, services):
+        """对所有 Lucky 服务做路径溯源，返回最终记录列表"""
+        self.index_services(services)
+        final_data = []
+        for i, ls in enumerate(self.services):
+            if (i+1) % 10 == 0 or i == 0:
+                self._log(f"[*] 正在处理第 {i+1}/{len(self.services)} 个服务: {ls['domain']}")
+            final_data.append(self.resolve(ls))
+        return final_data
+
+    def resolve(self, ls):
+        """
+        对单个 Lucky 服务做路径溯源：CF/DNS 查询、静态映射、端口映射、前置 / 后置 FRP、
+        STUN 路由、回环地址替换与描述链条构建。STUN 目标在 index_services 建立的索引中查找
+        """
+        raw_domain = ls['domain']
+        internal_addr = ls['internal_addr']
+        server_name = ls['server_name']
+        lucky_ip = self.server_ips.get(server_name)
+        
+        # A. 解析域名真实 IP
+        domain = raw_domain.split(':')[0]
+        frontend_port = raw_domain.split(':')[1] if ':' in raw_domain else None
+
+        # 优先用 CF 缓存查询，拿不到再用系统 DNS
+        cf_rec = self.lookup_cf(domain)
+        if cf_rec:
+            ip = cf_rec['content']
+            if cf_rec.get('proxied'):
+                mapping_provider = "CF proxy"
+            else:
+                mapping_provider = self.ip_aliases.get(ip, "Direct")
+        else:
+            ip = self.lookup_ip(domain)
+            mapping_provider = self.ip_aliases.get(ip, get_mapping_type(ip))
+        
+        
+        # B. 检查静态映射
+        matched_sm = self.match_static(domain)
+        
+
+        # C. 确定访问端口
+        display_port = frontend_port
+        if matched_sm:
+            p_map = matched_sm.get("port_map", {})
+            local_p = internal_addr.split(':')[-1] if ':' in internal_addr else ""
+            if str(frontend_port) in p_map:
+                display_port = p_map[str(frontend_port)]
+            elif str(local_p) in p_map:
+                display_port = p_map[str(local_p)]
+
+        # D. 深度路径溯源 (FRP 关联)
+        
+        # D.1 前置 FRP (Entry ➔ FRPS ➔ Lucky)
+        matching_pre_frp = None
+        path_pre_frp_info = ""
+        target_fp = str(frontend_port) if frontend_port else ("443" if ls.get("protocol") == "https" else "80")
+
+
+        # 重点：如果服务没有匹配 static_mappings，且 Lucky 本身在内网，探测 Pre-Lucky FRP
+        # 匹配逻辑 (见 FrpIndex.match_pre_lucky)：
+        # 1. FRP 服务的 server_addr 匹配我们解析到的域名的 IP (即 FRPS)
+        # 2. FRP 的 remote_port OR local_port 匹配前端访问端口
+        # 3. FRP 的 local_ip 指向当前 Lucky 的 IP (或回环地址)
+        if not matched_sm:
+            fm = self.frp_index.match_pre_lucky(ip, target_fp, lucky_ip)
+            if fm:
+                matching_pre_frp = fm
+                p_remote = str(fm.get('remote_port'))
+                l_port = str(fm.get('local_port'))
+                r_name = fm.get('name', '未命名')
+                source = fm.get('source_file', '未知')
+                
+                # 构造更准确的描述
+                if l_port == target_fp and p_remote != target_fp:
+                    path_pre_frp_info = f"FRP 入站 | {source}({r_name}): {p_remote} ➔ {l_port} (内网Lucky)"
+                else:
+                    path_pre_frp_info = f"FRP 入站 | {source}({r_name}): {p_remote} ➔ {l_port}"
+                
+                # 关键修复：既然是通过 FRP 入站，对外访问端口必须是 remote_port
+                display_port = p_remote
+                    
+                self._log(f"  [*] 匹配 Pre-Lucky FRP: {path_pre_frp_info} (更新对外端口为: {display_port})")
+            
+
+        # D.2 后置 FRP (Lucky ➔ 后端服务)
+        matching_frp = None
+        path_frp_info = ""
+        
+        # 提取 Lucky 后端端口
+        lucky_backend_port = None
+        if ':' in internal_addr:
+            try:
+                # 兼容 http://127.0.0.1:8099/ 或 127.0.0.1:8099
+                addr_clean = internal_addr.split('://')[-1].split('/')[0]
+                if ':' in addr_clean:
+                    lucky_backend_port = addr_clean.split(':')[-1]
+            except: pass
+
+        if lucky_backend_port:
+            # 提取原始协议
+            original_proto = ""
+            if "://" in internal_addr:
+                original_proto = internal_addr.split("://")[0] + "://"
+
+            # 寻找关联的 FRP 规则：Lucky 后端访问的端口，在 FRP 体系中通常是 remote_port (由客户端穿透到服务端)，
+            # 并且该 FRP 必须属于当前 Lucky 所在服务器 (见 FrpIndex.match_post_lucky)
+            fm = self.frp_index.match_post_lucky(lucky_backend_port, lucky_ip)
+            if fm:
+                matching_frp = fm
+                l_ip = fm.get('local_ip', '127.0.0.1')
+                l_port = fm.get('local_port', '未知')
+                r_port = fm.get('remote_port', '未知')
+                source = fm.get('source_file', '未知配置')
+                rule_name = fm.get('name', '匿名规则')
+                
+                # 把规则名也放进显示信息中
+                display_source = f"{source}({rule_name})"
+                
+                # 拼接带协议的详细路径
+                frp_target_with_proto = f"{original_proto}{l_ip}:{l_port}"
+                
+                if str(r_port) == str(lucky_backend_port):
+                    path_frp_info = f"FRP 穿透 | {display_source}: ➔ {frp_target_with_proto}"
+                else:
+                    path_frp_info = f"FRP 关联 | {display_source}: ➔ {frp_target_with_proto}"
+                
+                self._log(f"[*] {domain} ➔ 成功匹配 FRP 路径: {display_source} ➔ {frp_target_with_proto}")
+
+        # E. 构造 URL
+        # 优先遵守 Lucky 前端抓取到的原始协议
+        protocol = ls.get("protocol", "http")
+        
+        # 只有在静态映射中显式开启 TLS 时才强制 https，不再根据端口自动判断
+        if matched_sm and matched_sm.get("TLS") is True:
+            protocol = "https"
+
+        if protocol == "https":
+            if display_port and str(display_port) != "443":
+                access_url = f"https://{domain}:{display_port}"
+            else:
+                access_url = f"https://{domain}"
+        else:
+            if display_port and str(display_port) != "80":
+                access_url = f"http://{domain}:{display_port}"
+            else:
+                access_url = f"http://{domain}"
+        
+        # F. 处理 STUN 路由分析 (如果配置了 stun_route)
+        stun_server_name = "未知"
+        stun_internal_addr = "未知"
+        stun_node_ip = None
+        if matched_sm and "stun_route" in matched_sm:
+            for pattern, replacement in self.static_matcher.stun_routes(matched_sm):
+                if pattern.search(domain):
+                    # 根据规则生成目标 STUN 域名，并清理掉由于正则转义可能带入的斜杠
+                    target_stun_domain = pattern.sub(replacement, domain).replace('\\', '')
+                    # 在已抓取的 Lucky 服务中寻找对应条目
+                    other_ls = self.services_by_host.get(target_stun_domain)
+                    if other_ls:
+                        # 修改要求：stun_server_name 加 () 内添加转换后的服务地址
+                        stun_server_name = f"{other_ls.get('server_name', '未知')} ({target_stun_domain})"
+                        stun_internal_addr = other_ls.get('internal_addr', '未知')
+                        # 捕获 STUN 节点的真实 IP
+                        stun_node_ip = self.server_ips.get(other_ls.get('server_name', ''))
+                    break
+
+        # G. 确定最终端点地址 (Internal Address)
+        # 优先级：STUN 后端 > FRP 本地地址 > Lucky 后端
+        raw_end_addr = "未知"
+        node_ip = lucky_ip # 默认使用当前节点的服务器 IP (已包含 myip 优先逻辑)
+        
+        if stun_internal_addr != "未知":
+            raw_end_addr = stun_internal_addr
+            if stun_node_ip: 
+                node_ip = stun_node_ip
+        elif matching_frp:
+            # 同样保留协议
+            original_proto = ""
+            if "://" in internal_addr:
+                original_proto = internal_addr.split("://")[0] + "://"
+            raw_end_addr = f"{original_proto}{matching_frp.get('local_ip', '127.0.0.1')}:{matching_frp.get('local_port', '未知')}"
+        else:
+            raw_end_addr = internal_addr
+
+        # 处理 127.0.0.1 替换逻辑
+        final_internal_addr = raw_end_addr
+        if "127.0.0.1" in raw_end_addr or "localhost" in raw_end_addr:
+            if node_ip and node_ip != "未知":
+                final_internal_addr = raw_end_addr.replace("127.0.0.1", node_ip).replace("localhost", node_ip)
+
+        # H. 描述链条构建
+        path_segments = []
+        path_segments.append(f"{ip} ({mapping_provider})")
+        if path_pre_frp_info:
+            path_segments.append(path_pre_frp_info)
+        path_segments.append(f"{server_name} ({lucky_ip})")
+        path_segments.append(f"后端: {internal_addr}")
+        if matching_frp:
+            path_segments.append(path_frp_info)
+
+        if matched_sm:
+            chain = matched_sm['description'].replace("{server_name}", server_name).replace("{internal_addr}", internal_addr).replace("{ip}", ip)
+            chain = chain.replace("{port}", str(display_port) if display_port else "")
+            # 注入 STUN 变量 (如果有)
+            chain = chain.replace("{stun_server_name}", stun_server_name).replace("{stun_internal_addr}", stun_internal_addr)
+            
+            # 如果有 FRP 穿透信息，尝试追加到描述中（如果用户没写定义）
+            if matching_frp and "FRP" not in chain:
+                chain += f" ➔ {path_frp_info}"
+        else:
+            chain = " ➔ ".join(path_segments)
+
+        return {
+            "domain": domain,
+            "server_name": server_name,
+            "icon": f"favicons/{domain}.png",
+            "internal_addr": final_internal_addr,
+            "chain": chain,
+            "frp_info": path_frp_info if path_frp_info else "无",
+            "ip": ip,
+            "access_url": access_url,
+            "comment": matched_sm.get("comment", "") if matched_sm else "",
+            "undisplay": matched_sm.get("undisplay", False) if matched_sm else False
+        }
@@ -1,7 +1,59 @@
 import os
 import re
+import json
+import threading
 import configparser
 
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# 解析结果缓存: 路径 ➔ ((mtime_ns, size), 结果)，文件未变化时不重新读取和解析
+_unit_cache = {}
+_parse_cache = {}
+_cache_lock = threading.Lock()
+
+def _file_key(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _cached(cache, path, loader):
+    """按 path + mtime + size 缓存 loader(path) 的结果"""
+    try:
+        key = _file_key(path)
+    except OSError:
+        return None
+    with _cache_lock:
+        hit = cache.get(path)
+    if hit and hit[0] == key:
+        return hit[1]
+    result = loader(path)
+    with _cache_lock:
+        cache[path] = (key, result)
+    return result
+
+def clear_cache(path=None):
+    """清除解析缓存 (path 为空时全部清除)"""
+    with _cache_lock:
+        for cache in (_unit_cache, _parse_cache):
+            if path is None:
+                cache.clear()
+            else:
+                cache.pop(path, None)
+
+def _read_unit(path):
+    """读取 systemd unit，返回 ExecStart 中的配置文件路径 (找不到时为 None)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    # Find ExecStart to get the config file path
+    # Handles multiple formats: -c path/to/config or path/to/config
+    match = re.search(r'ExecStart=.*? (-c\s+|)([^\s\n]+)', content)
+    return match.group(2).strip() if match else None
+
 def get_frp_configs(systemd_dir="/lib/systemd/system"):
     configs = []
     if not os.path.exists(systemd_dir):
@@ -10,95 +62,195 @@ def get_frp_configs(systemd_dir="/lib/systemd/system"):
         return configs
 
     # Find service files starting with frpc
-    service_files = [f for f in os.listdir(systemd_dir) if f.startswith('frpc') and f.endswith('.service')]
-    
+    service_files = sorted(f for f in os.listdir(systemd_dir) if f.startswith('frpc') and f.endswith('.service'))
+
     for service_file in service_files:
         path = os.path.join(systemd_dir, service_file)
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # Find ExecStart to get the config file path
-                # Handles multiple formats: -c path/to/config or path/to/config
-                match = re.search(r'ExecStart=.*? (-c\s+|)([^\s\n]+)', content)
-                if match:
-                    config_path = match.group(2).strip()
-                    if os.path.exists(config_path):
-                        configs.append({
-                            'service': service_file,
-                            'config_path': config_path
-                        })
-                    else:
-                        print(f"[!] Found config path {config_path} but it does not exist.")
+            config_path = _cached(_unit_cache, path, _read_unit)
+            if config_path:
+                if os.path.exists(config_path):
+                    configs.append({
+                        'service': service_file,
+                        'config_path': config_path
+                    })
+                else:
+                    print(f"[!] Found config path {config_path} but it does not exist.")
         except Exception as e:
             print(f"Error reading {service_file}: {e}")
-            
+
     return configs
 
-def parse_frp_config(config_path):
+def expand_ports(spec):
+    """展开端口范围 "6000-6002,6010" ➔ ["6000", "6001", "6002", "6010"]；端口不是数字时抛出 ValueError"""
+    ports = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (int(p) for p in part.split('-', 1))
+            ports.extend(str(p) for p in range(start, end + 1))
+        else:
+            ports.append(str(int(part)))
+    return ports
+
+def _mapping(name, local_ip, local_port, remote_port, server_addr, source):
+    return {
+        'name': name,
+        'local_ip': local_ip or "127.0.0.1",
+        'local_port': str(local_port),
+        'remote_port': str(remote_port),
+        'server_addr': server_addr,
+        'source_file': source
+    }
+
+def _range_mappings(name, local_ip, local_ports, remote_ports, server_addr, source):
+    """
+    端口范围映射按 frp 的规则展开为多条：name_0, name_1 ...
+    两侧端口数量不一致或端口无法解析时视为无效配置，只跳过这一个代理
+    """
+    try:
+        local_list, remote_list = expand_ports(local_ports), expand_ports(remote_ports)
+    except ValueError:
+        print(f"[!] {source}({name}): 无法解析端口 local_port={local_ports!r} remote_port={remote_ports!r}，已忽略")
+        return []
+    if len(local_list) != len(remote_list):
+        print(f"[!] {source}({name}): local_port 与 remote_port 的端口数量不一致，已忽略")
+        return []
+    if len(local_list) == 1:
+        return [_mapping(name, local_ip, local_list[0], remote_list[0], server_addr, source)]
+    return [_mapping(f"{name}_{i}", local_ip, l, r, server_addr, source)
+            for i, (l, r) in enumerate(zip(local_list, remote_list))]
+
+def _from_structured(data, source):
+    """
+    TOML / YAML / JSON 格式 (frp v0.52.0+) 共用同一套结构:
+    serverAddr + proxies 列表 (也兼容 [proxies.xxx] 形式的表，表名作为代理名)
+    """
+    server_addr = data.get('serverAddr', data.get('server_addr', 'unknown'))
+    proxies = data.get('proxies') or []
+    if isinstance(proxies, dict):
+        proxies = [dict(p, name=p.get('name', name)) for name, p in proxies.items() if isinstance(p, dict)]
+
     mappings = []
-    if not os.path.exists(config_path):
-        return mappings
+    for proxy in proxies:
+        if not isinstance(proxy, dict):
+            continue
+        local_port = proxy.get('localPort', proxy.get('local_port'))
+        remote_port = proxy.get('remotePort', proxy.get('remote_port'))
+        if local_port is None or remote_port is None:
+            continue
+        mappings.extend(_range_mappings(proxy.get('name', 'unnamed'),
+                                        proxy.get('localIP', proxy.get('local_ip')),
+                                        local_port, remote_port, server_addr, source))
+    return mappings
+
+def _parse_toml_regex(content, source):
+    """没有 tomllib 或文件无法按 TOML 解析 (例如使用了 Go 模板语法) 时的兜底：逐个 [[proxies]] 块用正则提取"""
+    mappings = []
+    # Extract common server_addr
+    server_addr = "unknown"
+    server_match = re.search(r'serverAddr\s*=\s*"([^"]+)"', content)
+    if server_match: server_addr = server_match.group(1)
 
-    config_filename = os.path.basename(config_path)
+    # Find proxies [[proxies]]
+    proxy_blocks = re.findall(r'\[\[proxies\]\](.*?)(?=\[\[proxies\]\]|$)', content, re.DOTALL)
+    for block in proxy_blocks:
+        name_m = re.search(r'name\s*=\s*"([^"]+)"', block)
+        lip_m = re.search(r'localIP\s*=\s*"([^"]+)"', block)
+        lport_m = re.search(r'localPort\s*=\s*(\d+)', block)
+        rport_m = re.search(r'remotePort\s*=\s*(\d+)', block)
+        if lport_m and rport_m:
+            mappings.append(_mapping(name_m.group(1) if name_m else "unnamed",
+                                     lip_m.group(1) if lip_m else "127.0.0.1",
+                                     lport_m.group(1), rport_m.group(1), server_addr, source))
+    return mappings
+
+def _parse_toml(content, source):
+    if tomllib is not None:
+        try:
+            return _from_structured(tomllib.loads(content), source)
+        except tomllib.TOMLDecodeError:
+            pass
+    return _parse_toml_regex(content, source)
+
+def _parse_yaml(content, source):
     try:
-        # Check if it's TOML (v0.52.0+)
-        is_toml = False
-        with open(config_path, 'r', encoding='utf-8') as f:
-            content_sample = f.read(2048) # Read a sample
-            # FRPC TOML 常见的特征是包含 [[proxies]] 或以 .toml 结尾
-            if '[[proxies]]' in content_sample or config_path.endswith('.toml'):
-                is_toml = True
-        
-        if is_toml:
-            # Simple TOML parser logic for proxy definitions
-            with open(config_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Extract common server_addr
-            server_addr = "unknown"
-            server_match = re.search(r'serverAddr\s*=\s*"([^"]+)"', content)
-            if server_match: server_addr = server_match.group(1)
-            
-            # Find proxies [[proxies]]
-            proxy_blocks = re.findall(r'\[\[proxies\]\](.*?)(?=\[\[proxies\]\]|$)', content, re.DOTALL)
-            for block in proxy_blocks:
-                name_m = re.search(r'name\s*=\s*"([^"]+)"', block)
-                lip_m = re.search(r'localIP\s*=\s*"([^"]+)"', block)
-                lport_m = re.search(r'localPort\s*=\s*(\d+)', block)
-                rport_m = re.search(r'remotePort\s*=\s*(\d+)', block)
-                if lport_m and rport_m:
-                    mappings.append({
-                        'name': name_m.group(1) if name_m else "unnamed",
-                        'local_ip': lip_m.group(1) if lip_m else "127.0.0.1",
-                        'local_port': lport_m.group(1),
-                        'remote_port': rport_m.group(1),
-                        'server_addr': server_addr,
-                        'source_file': config_filename
-                    })
-        else:
-            # INI parser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            server_addr = config.get('common', 'server_addr', fallback='unknown')
-            
-            for section in config.sections():
-                if section == 'common': continue
-                local_ip = config.get(section, 'local_ip', fallback='127.0.0.1')
-                local_port = config.get(section, 'local_port', fallback=None)
-                remote_port = config.get(section, 'remote_port', fallback=None)
-                if local_port and remote_port:
-                    mappings.append({
-                        'name': section,
-                        'local_ip': local_ip,
-                        'local_port': local_port,
-                        'remote_port': remote_port,
-                        'server_addr': server_addr,
-                        'source_file': config_filename
-                    })
+        import yaml
+    except ImportError:
+        print(f"[!] 未安装 PyYAML，跳过 {source}")
+        return []
+    return _from_structured(yaml.safe_load(content) or {}, source)
+
+def _parse_ini(content, source):
+    config = configparser.ConfigParser(interpolation=None)
+    config.read_string(content)
+    server_addr = config.get('common', 'server_addr', fallback='unknown')
+
+    mappings = []
+    for section in config.sections():
+        if section == 'common': continue
+        local_ip = config.get(section, 'local_ip', fallback='127.0.0.1')
+        local_port = config.get(section, 'local_port', fallback=None)
+        remote_port = config.get(section, 'remote_port', fallback=None)
+        if local_port and remote_port:
+            # [range:name] 段为端口范围映射
+            name = section.split(':', 1)[1] if section.startswith('range:') else section
+            mappings.extend(_range_mappings(name, local_ip, local_port, remote_port, server_addr, source))
+    return mappings
+
+def detect_format(config_path, content):
+    ext = os.path.splitext(config_path)[1].lower()
+    if ext in ('.toml', '.ini', '.json'):
+        return ext[1:]
+    if ext in ('.yaml', '.yml'):
+        return 'yaml'
+    # 没有可识别的扩展名时按内容判断
+    sample = content[:2048]
+    if sample.lstrip().startswith('{'):
+        return 'json'
+    # FRPC TOML 常见的特征是包含 [[proxies]] 或 serverAddr
+    if '[[proxies]]' in sample or re.search(r'^\s*serverAddr\s*=', sample, re.M):
+        return 'toml'
+    if re.search(r'^\s*serverAddr\s*:', sample, re.M) or re.search(r'^\s*proxies\s*:', sample, re.M):
+        return 'yaml'
+    return 'ini'
+
+_PARSERS = {
+    'toml': _parse_toml,
+    'yaml': _parse_yaml,
+    'json': lambda content, source: _from_structured(json.loads(content), source),
+    'ini': _parse_ini,
+}
+
+def parse_frp_text(content, source, config_path=""):
+    """解析配置文本 (例如 frpc 管理接口 /api/config 返回的内容)，格式按 config_path 的扩展名或内容判断"""
+    return _PARSERS[detect_format(config_path, content)](content, source)
+
+def _load_config(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return parse_frp_text(content, os.path.basename(config_path), config_path)
+
+def parse_frp_config(config_path):
+    """解析单个 frpc 配置 (TOML / INI / YAML / JSON)，文件未变化时直接返回缓存的结果"""
+    if not os.path.exists(config_path):
+        return []
+    try:
+        mappings = _cached(_parse_cache, config_path, _load_config) or []
     except Exception as e:
         print(f"Error parsing config {config_path}: {e}")
-        
-    return mappings
+        return []
+    # 返回副本，调用方修改映射字典不会污染缓存
+    return [dict(m) for m in mappings]
+
+def parse_frp_configs(config_paths):
+    """
+    解析多个配置，结果按 config_paths 的顺序拼接
+    解析是纯 CPU 计算，受 GIL 限制线程池并不会更快，因此顺序解析；未变化的文件直接命中缓存
+    """
+    return [m for p in config_paths for m in parse_frp_config(p)]
 
 if __name__ == "__main__":
     # Test logic
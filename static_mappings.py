@@ -0,0 +1,61 @@
+import re
+
+# 含反向引用 / 命名分组 / 条件分组引用 (?(1)...) 的 pattern 无法安全地拼进同一个正则 (合并后分组编号会偏移)
+_UNSAFE_RE = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(')
+
+class StaticMappingMatcher:
+    """
+    static_mappings 预编译匹配器，在加载配置时构建一次
+    - 所有 pattern 合并成一个带命名分组的交替正则 (?P<m0>...)|(?P<m1>...)，
+      re.match 按交替顺序尝试，结果与逐条 re.match 的“第一条命中”一致
+    - 合并失败 (含反向引用、内联 flag 等) 时退回到逐条预编译的正则
+    - stun_route 的 pattern 同样预编译
+    """
+    def __init__(self, static_mappings):
+        self.mappings = []
+        self._compiled = []
+        for sm in static_mappings or []:
+            try:
+                self._compiled.append(re.compile(sm['pattern']))
+                self.mappings.append(sm)
+            except (re.error, KeyError, TypeError) as e:
+                print(f"[!] 忽略无效的 static_mappings 规则 {sm.get('pattern')!r}: {e}")
+
+        self._combined = None
+        self._group_to_mapping = {}
+        if self.mappings and not any(_UNSAFE_RE.search(sm['pattern']) for sm in self.mappings):
+            try:
+                combined = re.compile('|'.join(f"(?P<m{i}>{sm['pattern']})" for i, sm in enumerate(self.mappings)))
+                self._group_to_mapping = {combined.groupindex[f"m{i}"]: sm for i, sm in enumerate(self.mappings)}
+                self._combined = combined
+            except re.error:
+                pass
+
+        # id(规则) ➔ [(编译后的 pattern, replacement), ...]
+        self._stun_routes = {}
+        for sm in self.mappings:
+            routes = []
+            for pattern, replacement in (sm.get("stun_route") or {}).items():
+                try:
+                    routes.append((re.compile(pattern), replacement))
+                except re.error as e:
+                    print(f"[!] 忽略无效的 stun_route 规则 {pattern!r}: {e}")
+            self._stun_routes[id(sm)] = routes
+
+    def __len__(self):
+        return len(self.mappings)
+
+    def match(self, domain):
+        """返回第一条 pattern 匹配该域名的静态映射 (与 re.match 语义一致)"""
+        if self._combined is not None:
+            m = self._combined.match(domain)
+            # 外层命名分组最后闭合，lastindex 即为命中的规则分组
+            return self._group_to_mapping.get(m.lastindex) if m else None
+        for sm, compiled in zip(self.mappings, self._compiled):
+            if compiled.match(domain):
+                return sm
+        return None
+
+    def stun_routes(self, sm):
+        """静态映射对应的预编译 stun_route 列表"""
+        return self._stun_routes.get(id(sm), [])
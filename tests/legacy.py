@@ -0,0 +1,188 @@
+"""
+重构前 main.py 中的逐条遍历实现 (服务 × FRP 映射的嵌套循环、逐条 re.match、CF 记录线性扫描)，
+只把网络查询换成传入的字典，作为 FrpIndex / ServiceResolver / CF 索引等价性测试的参照
+"""
+import re
+
+from utils import get_mapping_type
+
+
+def legacy_cf_lookup(records, domain):
+    """重构前 cf_dns.resolve_domain_with_cache 的线性扫描"""
+    if not records:
+        return None
+    dom_lower = domain.lower()
+    for rec in records:
+        if rec['name'] == dom_lower:
+            return rec
+    for rec in records:
+        if '*' in rec['name']:
+            suffix = rec['name'].replace('*', '')
+            if dom_lower.endswith(suffix) and dom_lower != suffix.lstrip('.'):
+                return rec
+    return None
+
+
+def legacy_resolve_all(lucky_services, all_frp_mappings, lucky_server_ips, static_mappings,
+                       cf_records, host_ips, ip_aliases):
+    def resolve_domain(domain):
+        return host_ips.get(domain.lower()) or "Unknown"
+
+    final_data = []
+    for ls in lucky_services:
+        raw_domain = ls['domain']
+        internal_addr = ls['internal_addr']
+        server_name = ls['server_name']
+        lucky_ip = lucky_server_ips.get(server_name)
+
+        domain = raw_domain.split(':')[0]
+        frontend_port = raw_domain.split(':')[1] if ':' in raw_domain else None
+
+        cf_rec = legacy_cf_lookup(cf_records, domain)
+        if cf_rec:
+            ip = cf_rec['content']
+            if cf_rec.get('proxied'):
+                mapping_provider = "CF proxy"
+            else:
+                mapping_provider = ip_aliases.get(ip, "Direct")
+        else:
+            ip = resolve_domain(domain)
+            mapping_provider = ip_aliases.get(ip, get_mapping_type(ip))
+
+        matched_sm = None
+        for sm in static_mappings:
+            if re.match(sm['pattern'], domain):
+                matched_sm = sm
+                break
+
+        display_port = frontend_port
+        if matched_sm:
+            p_map = matched_sm.get("port_map", {})
+            local_p = internal_addr.split(':')[-1] if ':' in internal_addr else ""
+            if str(frontend_port) in p_map:
+                display_port = p_map[str(frontend_port)]
+            elif str(local_p) in p_map:
+                display_port = p_map[str(local_p)]
+
+        path_pre_frp_info = ""
+        target_fp = str(frontend_port) if frontend_port else ("443" if ls.get("protocol") == "https" else "80")
+        if not matched_sm:
+            for fm in all_frp_mappings:
+                f_server = fm.get('server_addr', '').lower()
+                p_remote = str(fm.get('remote_port'))
+                l_ip = fm.get('local_ip', '').lower()
+                l_port = str(fm.get('local_port'))
+                f_server_ip = f_server
+                if not re.match(r'^\d+\.\d+\.\d+\.\d+$', f_server):
+                    cf_rec_s = legacy_cf_lookup(cf_records, f_server)
+                    f_server_ip = cf_rec_s['content'] if cf_rec_s else resolve_domain(f_server)
+                ip_match = (f_server_ip.lower() == ip.lower())
+                port_match = (p_remote == target_fp or l_port == target_fp)
+                local_match = (l_ip in ['127.0.0.1', 'localhost', '0.0.0.0', (lucky_ip or "").lower()])
+                if ip_match and port_match and local_match:
+                    r_name = fm.get('name', '未命名')
+                    source = fm.get('source_file', '未知')
+                    if l_port == target_fp and p_remote != target_fp:
+                        path_pre_frp_info = f"FRP 入站 | {source}({r_name}): {p_remote} ➔ {l_port} (内网Lucky)"
+                    else:
+                        path_pre_frp_info = f"FRP 入站 | {source}({r_name}): {p_remote} ➔ {l_port}"
+                    display_port = p_remote
+                    break
+
+        matching_frp = None
+        path_frp_info = ""
+        lucky_backend_port = None
+        if ':' in internal_addr:
+            addr_clean = internal_addr.split('://')[-1].split('/')[0]
+            if ':' in addr_clean:
+                lucky_backend_port = addr_clean.split(':')[-1]
+
+        if lucky_backend_port:
+            original_proto = ""
+            if "://" in internal_addr:
+                original_proto = internal_addr.split("://")[0] + "://"
+            for fm in all_frp_mappings:
+                p_remote = str(fm.get('remote_port'))
+                p_local = str(fm.get('local_port'))
+                if p_remote == str(lucky_backend_port) or p_local == str(lucky_backend_port):
+                    f_server = fm.get('server_addr', '').lower()
+                    l_ip_target = (lucky_ip or "").lower()
+                    if (l_ip_target and f_server == l_ip_target) or f_server in ['127.0.0.1', 'localhost', '0.0.0.0']:
+                        matching_frp = fm
+                        display_source = f"{fm.get('source_file', '未知配置')}({fm.get('name', '匿名规则')})"
+                        frp_target_with_proto = f"{original_proto}{fm.get('local_ip', '127.0.0.1')}:{fm.get('local_port', '未知')}"
+                        if str(fm.get('remote_port', '未知')) == str(lucky_backend_port):
+                            path_frp_info = f"FRP 穿透 | {display_source}: ➔ {frp_target_with_proto}"
+                        else:
+                            path_frp_info = f"FRP 关联 | {display_source}: ➔ {frp_target_with_proto}"
+                        break
+
+        protocol = ls.get("protocol", "http")
+        if matched_sm and matched_sm.get("TLS") is True:
+            protocol = "https"
+        if protocol == "https":
+            access_url = f"https://{domain}:{display_port}" if display_port and str(display_port) != "443" else f"https://{domain}"
+        else:
+            access_url = f"http://{domain}:{display_port}" if display_port and str(display_port) != "80" else f"http://{domain}"
+
+        stun_server_name = "未知"
+        stun_internal_addr = "未知"
+        stun_node_ip = None
+        if matched_sm and "stun_route" in matched_sm:
+            for pattern, replacement in matched_sm["stun_route"].items():
+                if re.search(pattern, domain):
+                    target_stun_domain = re.sub(pattern, replacement, domain).replace('\\', '')
+                    for other_ls in lucky_services:
+                        if other_ls['domain'].split(':')[0] == target_stun_domain:
+                            stun_server_name = f"{other_ls.get('server_name', '未知')} ({target_stun_domain})"
+                            stun_internal_addr = other_ls.get('internal_addr', '未知')
+                            stun_node_ip = lucky_server_ips.get(other_ls.get('server_name', ''))
+                            break
+                    break
+
+        node_ip = lucky_ip
+        if stun_internal_addr != "未知":
+            raw_end_addr = stun_internal_addr
+            if stun_node_ip:
+                node_ip = stun_node_ip
+        elif matching_frp:
+            original_proto = internal_addr.split("://")[0] + "://" if "://" in internal_addr else ""
+            raw_end_addr = f"{original_proto}{matching_frp.get('local_ip', '127.0.0.1')}:{matching_frp.get('local_port', '未知')}"
+        else:
+            raw_end_addr = internal_addr
+
+        final_internal_addr = raw_end_addr
+        if "127.0.0.1" in raw_end_addr or "localhost" in raw_end_addr:
+            if node_ip and node_ip != "未知":
+                final_internal_addr = raw_end_addr.replace("127.0.0.1", node_ip).replace("localhost", node_ip)
+
+        path_segments = [f"{ip} ({mapping_provider})"]
+        if path_pre_frp_info:
+            path_segments.append(path_pre_frp_info)
+        path_segments.append(f"{server_name} ({lucky_ip})")
+        path_segments.append(f"后端: {internal_addr}")
+        if matching_frp:
+            path_segments.append(path_frp_info)
+
+        if matched_sm:
+            chain = matched_sm['description'].replace("{server_name}", server_name).replace("{internal_addr}", internal_addr).replace("{ip}", ip)
+            chain = chain.replace("{port}", str(display_port) if display_port else "")
+            chain = chain.replace("{stun_server_name}", stun_server_name).replace("{stun_internal_addr}", stun_internal_addr)
+            if matching_frp and "FRP" not in chain:
+                chain += f" ➔ {path_frp_info}"
+        else:
+            chain = " ➔ ".join(path_segments)
+
+        final_data.append({
+            "domain": domain,
+            "server_name": server_name,
+            "icon": f"favicons/{domain}.png",
+            "internal_addr": final_internal_addr,
+            "chain": chain,
+            "frp_info": path_frp_info if path_frp_info else "无",
+            "ip": ip,
+            "access_url": access_url,
+            "comment": matched_sm.get("comment", "") if matched_sm else "",
+            "undisplay": matched_sm.get("undisplay", False) if matched_sm else False
+        })
+    return final_data
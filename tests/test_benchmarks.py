@@ -0,0 +1,68 @@
+"""
+benchmarks/ 中基准的 pytest-benchmark 版本，结果与逐条遍历保持一致，并作为性能回归的门槛
+
+    python -m pytest tests/test_benchmarks.py --benchmark-autosave
+    python -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+import time
+
+import pytest
+
+pytest.importorskip("pytest_benchmark", reason="未安装 pytest-benchmark，请先 pip install -r requirements-dev.txt")
+
+from benchmarks.bench_frp_index import make_fleet as make_frp_fleet, naive_post, naive_pre, resolve_server
+from benchmarks.bench_resolver import make_fleet as make_resolver_fleet
+from frp_index import FrpIndex
+from resolver import ServiceResolver
+
+
+@pytest.fixture(scope="module")
+def frp_fleet():
+    services, mappings = make_frp_fleet(2000, 2000)
+    # 让一部分服务必定命中
+    for s, fm in zip(services[::7], mappings[::3]):
+        s['port'] = fm['remote_port']
+        s['backend_port'] = fm['local_port']
+    return services, mappings
+
+
+def lookup_all(index, services):
+    return [(index.match_pre_lucky(s['ip'], s['port'], s['lucky_ip']),
+             index.match_post_lucky(s['backend_port'], s['lucky_ip'])) for s in services]
+
+
+def test_frp_index_build(benchmark, frp_fleet):
+    _, mappings = frp_fleet
+    index = benchmark(FrpIndex, mappings, resolve_server)
+    assert index is not None
+
+
+def test_frp_index_lookup(benchmark, frp_fleet):
+    services, mappings = frp_fleet
+    index = FrpIndex(mappings, resolve_server)
+    fast = benchmark(lookup_all, index, services)
+
+    sample = services[:200]
+    started = time.perf_counter()
+    slow = [(naive_pre(mappings, s['ip'], s['port'], s['lucky_ip']),
+             naive_post(mappings, s['backend_port'], s['lucky_ip'])) for s in sample]
+    naive = (time.perf_counter() - started) * len(services) / len(sample)
+
+    assert slow == fast[:len(sample)], "索引结果与逐条遍历不一致"
+    assert any(pre or post for pre, post in fast)
+    # 索引查询至少要比逐条遍历快一个数量级 (--benchmark-disable 时没有统计数据)
+    if benchmark.stats is not None:
+        assert benchmark.stats.stats.mean * 10 < naive
+
+
+@pytest.mark.parametrize("n_services", [100, 1000])
+def test_service_resolver(benchmark, n_services):
+    services, frp_mappings, cf_records, server_ips, static_mappings = make_resolver_fleet(n_services)
+
+    def run():
+        resolver = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings,
+                                   cf_records=cf_records, verbose=False)
+        return resolver.resolve_all(services)
+
+    records = benchmark(run)
+    assert len(records) == n_services
@@ -0,0 +1,141 @@
+import json
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import cf_dns
+from cf_dns import fetch_all_cf_records, get_cf_records
+
+ZONE_PAGE_CAP = 1
+
+
+class _CloudflareApi:
+    """模拟 Cloudflare v4 的 /zones 与 /zones/{id}/dns_records 列表接口"""
+    def __init__(self):
+        self.zones = [{"id": "z1", "name": "example.com"}, {"id": "z2", "name": "demo.net"}]
+        self.records = {
+            "z1": [self.record("r1", "a.example.com", "1.1.1.1"), self.record("r2", "b.example.com", "2.2.2.2")],
+            "z2": [self.record(f"d{i}", f"h{i}.demo.net", f"10.0.0.{i}") for i in range(3)],
+        }
+        self.requests = []
+        # 每个路径第一次请求返回 429
+        self.throttle = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def record(rec_id, name, content, modified_on="2024-01-01T00:00:00Z"):
+        return {"id": rec_id, "name": name, "content": content, "type": "A", "proxied": False, "modified_on": modified_on}
+
+    def handle(self, path, query):
+        with self.lock:
+            self.requests.append((path, query))
+            if path in self.throttle:
+                self.throttle.discard(path)
+                return 429, None
+        per_page = int(query.get("per_page", ["100"])[0])
+        page = int(query.get("page", ["1"])[0])
+        if path == "/zones":
+            items, per_page = self.zones, min(per_page, ZONE_PAGE_CAP)
+        elif path.startswith("/zones/") and path.endswith("/dns_records"):
+            if "order" in query:
+                return 400, {"success": False, "errors": [{"message": "invalid order"}]}
+            items = self.records[path.split("/")[2]]
+        else:
+            return 404, None
+        total_pages = max(1, math.ceil(len(items) / per_page))
+        return 200, {"success": True, "result": items[(page - 1) * per_page:page * per_page],
+                     "result_info": {"page": page, "per_page": per_page, "total_pages": total_pages,
+                                     "count": len(items), "total_count": len(items)}}
+
+    def record_requests(self, zone_id):
+        return [q for p, q in self.requests if p == f"/zones/{zone_id}/dns_records"]
+
+
+@pytest.fixture
+def cf_api(monkeypatch):
+    api = _CloudflareApi()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, body = api.handle(url.path, parse_qs(url.query))
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            if body is not None:
+                self.wfile.write(json.dumps(body).encode())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # 分页大小调小，让 z2 必须分两页拉取
+    monkeypatch.setattr(cf_dns, "RECORD_PAGE_SIZE", 2)
+    api.base = f"http://127.0.0.1:{server.server_port}"
+    yield api
+    server.shutdown()
+    server.server_close()
+
+
+def _sync(api, snapshot_file):
+    api.requests.clear()
+    fetch_all_cf_records("token", max_workers=2, api_base=api.base, snapshot_file=str(snapshot_file), snapshot_ttl=0)
+    return {rec["name"]: rec["content"] for rec in get_cf_records()}
+
+
+def test_full_sync_paginates_and_backs_off(cf_api, tmp_path):
+    cf_api.throttle = {"/zones", "/zones/z2/dns_records"}
+    records = _sync(cf_api, tmp_path / "cf.json")
+
+    assert records == {"a.example.com": "1.1.1.1", "b.example.com": "2.2.2.2",
+                       "h0.demo.net": "10.0.0.0", "h1.demo.net": "10.0.0.1", "h2.demo.net": "10.0.0.2"}
+    # 两页 Zone + 一次 429 重试
+    assert len([q for p, q in cf_api.requests if p == "/zones"]) == 3
+    # z1 单页：只有一次请求；z2：429 重试 + 两页
+    assert len(cf_api.record_requests("z1")) == 1
+    assert [q["page"] for q in cf_api.record_requests("z2")] == [["1"], ["1"], ["2"]]
+    assert (tmp_path / "cf.json").stat().st_mode & 0o777 == 0o600
+
+
+def test_probe_hit_reuses_snapshot(cf_api, tmp_path, capsys):
+    snapshot = tmp_path / "cf.json"
+    _sync(cf_api, snapshot)
+    capsys.readouterr()
+    records = _sync(cf_api, snapshot)
+
+    assert len(records) == 5
+    assert "1 个 Zone 未变化，1 个需要重新同步" in capsys.readouterr().out
+    # z1 未变化只请求第一页；z2 有多页，接着第一页拉取第二页
+    assert len(cf_api.record_requests("z1")) == 1
+    assert [q["page"] for q in cf_api.record_requests("z2")] == [["1"], ["2"]]
+
+
+@pytest.mark.parametrize("change", ["edit", "replace", "delete"])
+def test_probe_miss_picks_up_record_changes(cf_api, tmp_path, change):
+    snapshot = tmp_path / "cf.json"
+    _sync(cf_api, snapshot)
+    z1 = cf_api.records["z1"]
+    if change == "edit":
+        # 记录总数不变，只改内容
+        z1[0] = cf_api.record("r1", "a.example.com", "9.9.9.9", "2024-02-01T00:00:00Z")
+    elif change == "replace":
+        # 删一条、加一条，总数不变
+        z1[1] = cf_api.record("r3", "c.example.com", "3.3.3.3")
+    else:
+        del z1[1]
+    records = _sync(cf_api, snapshot)
+
+    expected = {
+        "edit": {"a.example.com": "9.9.9.9", "b.example.com": "2.2.2.2"},
+        "replace": {"a.example.com": "1.1.1.1", "c.example.com": "3.3.3.3"},
+        "delete": {"a.example.com": "1.1.1.1"},
+    }[change]
+    assert {k: v for k, v in records.items() if k.endswith("example.com")} == expected
+    # 单页 Zone 的第一页即完整记录，不再重复请求
+    assert len(cf_api.record_requests("z1")) == 1
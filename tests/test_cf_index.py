@@ -0,0 +1,35 @@
+import random
+
+from cf_dns import build_cf_index, lookup_cf_index
+from legacy import legacy_cf_lookup
+
+
+def test_lookup_matches_linear_scan():
+    rnd = random.Random(3)
+    zones = [f"zone{i}.example.com" for i in range(20)]
+    records = [{"name": f"svc{i}.{rnd.choice(zones)}", "content": f"10.0.0.{i % 250}"} for i in range(300)]
+    # 泛域名互不嵌套时，线性扫描与 trie 的结果应当一致
+    records += [{"name": f"*.{z}", "content": "1.2.3.4"} for z in zones[::2]]
+    exact, wildcards = build_cf_index(records)
+
+    queries = [r["name"] for r in records] + [f"x{i}.{z}" for i, z in enumerate(zones)] + zones
+    queries += [q.upper() for q in queries[:20]] + ["example.com", "nothing.org", "a.b.zone0.example.com"]
+    for q in queries:
+        assert lookup_cf_index(exact, wildcards, q) is legacy_cf_lookup(records, q), q
+
+
+def test_wildcard_rules():
+    exact, wildcards = build_cf_index([
+        {"name": "*.example.com", "content": "1"},
+        {"name": "*.lab.example.com", "content": "2"},
+        {"name": "www.example.com", "content": "3"},
+        {"name": "www.example.com", "content": "dup"},
+    ])
+    assert lookup_cf_index(exact, wildcards, "www.example.com")["content"] == "3"
+    assert lookup_cf_index(exact, wildcards, "a.example.com")["content"] == "1"
+    # 泛域名不匹配自身的根域名
+    assert lookup_cf_index(exact, wildcards, "example.com") is None
+    # 嵌套泛域名取最具体的一条
+    assert lookup_cf_index(exact, wildcards, "x.lab.example.com")["content"] == "2"
+    assert lookup_cf_index(exact, wildcards, "lab.example.com")["content"] == "1"
+    assert lookup_cf_index(exact, wildcards, "WWW.Example.com.")["content"] == "3"
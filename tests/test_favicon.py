@@ -0,0 +1,56 @@
+import os
+import time
+
+import pytest
+
+import output_writer
+from favicon import FaviconFetcher
+
+
+class _Response:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {"ETag": '"v1"'}
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = FaviconFetcher(str(tmp_path), max_workers=2)
+    yield fetcher
+    fetcher.close()
+
+
+def test_backoff_regenerates_missing_placeholder(fetcher, tmp_path, monkeypatch):
+    fetcher.manifest.update("nas.example.com", failures=1, last_attempt=time.time())
+    # 退避期内不允许访问网络
+    monkeypatch.setattr(fetcher, "_get", lambda *a, **k: pytest.fail("退避期内访问了网络"))
+    records = [{"domain": "nas.example.com", "access_url": "https://nas.example.com"},
+               {"domain": "nas.example.com", "access_url": "https://nas.example.com:8443"}]
+
+    fetcher.fetch_all(records)
+    assert (tmp_path / "nas.example.com.pillow.png").exists()
+    assert [s['icon'] for s in records] == ["favicons/nas.example.com.pillow.png"] * 2
+    # 失败次数不因重新生成占位图而增加
+    assert fetcher.manifest.get("nas.example.com")["failures"] == 1
+
+    fetcher.fetch_all(records)
+    assert records[0]['icon'] == "favicons/nas.example.com.pillow.png"
+
+
+def test_save_icon_is_atomic(fetcher, tmp_path, monkeypatch):
+    path = tmp_path / "a.com.png"
+    path.write_bytes(b"old icon")
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(output_writer.os, "replace", crash)
+    with pytest.raises(OSError):
+        fetcher._save_icon("a.com", "https://a.com/favicon.ico", _Response(b"x" * 200), str(path))
+    assert path.read_bytes() == b"old icon"
+    assert os.listdir(tmp_path) == ["a.com.png"]
+
+    monkeypatch.undo()
+    fetcher._save_icon("a.com", "https://a.com/favicon.ico", _Response(b"x" * 200), str(path))
+    assert path.read_bytes() == b"x" * 200
+    assert fetcher.manifest.get("a.com")["etag"] == '"v1"'
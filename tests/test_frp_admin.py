@@ -0,0 +1,136 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from frp_admin import collect_frpc_admin, merge_mappings, status_to_mappings
+
+CONFIG_TEXT = '''serverAddr = "1.2.3.4"
+[[proxies]]
+name = "ssh"
+localPort = 22
+remotePort = 6022
+[[proxies]]
+name = "web"
+localIP = "192.168.1.2"
+localPort = 80
+remotePort = 8080
+'''
+
+STATUS = {
+    "tcp": [
+        {"name": "ssh", "type": "tcp", "status": "running", "local_addr": "127.0.0.1:22", "remote_addr": "1.2.3.4:6022"},
+        {"name": "web", "type": "tcp", "status": "start error", "local_addr": "192.168.1.2:80", "remote_addr": ""},
+        # 通过管理接口动态添加、配置文件中没有的代理
+        {"name": "dyn", "type": "tcp", "status": "running", "local_addr": "10.0.0.1:3389", "remote_addr": ":13389"},
+    ],
+    # 没有数字 remote 端口，应被跳过
+    "http": [{"name": "h", "type": "http", "status": "running", "local_addr": "127.0.0.1:81", "remote_addr": "http://a.example.com"}],
+}
+
+AUTH = "Basic " + base64.b64encode(b"admin:pw").decode()
+
+
+class _FrpcAdminHandler(BaseHTTPRequestHandler):
+    """模拟 frpc webServer 的 /api/status 与 /api/config (Basic 认证)"""
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("Authorization") != AUTH:
+            self.send_response(401)
+            self.end_headers()
+            return
+        if self.path == "/api/status":
+            body = json.dumps(STATUS).encode()
+        elif self.path == "/api/config":
+            body = CONFIG_TEXT.encode()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def frpc_admin_url():
+    server = HTTPServer(("127.0.0.1", 0), _FrpcAdminHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _by_name(mappings):
+    return {m['name']: m for m in mappings}
+
+
+def test_status_to_mappings_marks_running_and_adds_live_only_proxies():
+    config_mappings = [
+        {"name": "ssh", "local_ip": "127.0.0.1", "local_port": "22", "remote_port": "6022",
+         "server_addr": "1.2.3.4", "source_file": "x"},
+    ]
+    mappings = _by_name(status_to_mappings(STATUS, config_mappings, "1.2.3.4", "frpc-admin"))
+
+    assert set(mappings) == {"ssh", "dyn"}
+    assert mappings["ssh"]["running"] is True
+    assert mappings["ssh"]["source_file"] == "frpc-admin"
+    assert mappings["dyn"] == {
+        "name": "dyn", "local_ip": "10.0.0.1", "local_port": "3389", "remote_port": "13389",
+        "server_addr": "1.2.3.4", "source_file": "frpc-admin", "running": True,
+    }
+
+
+def test_collect_frpc_admin_against_stub_server(frpc_admin_url):
+    mappings = collect_frpc_admin([{"url": frpc_admin_url, "user": "admin", "pass": "pw", "name": "home"}], timeout=2)
+    by_name = _by_name(mappings)
+
+    assert set(by_name) == {"ssh", "web", "dyn"}
+    assert by_name["ssh"]["running"] is True
+    assert by_name["web"]["running"] is False
+    assert by_name["web"]["local_ip"] == "192.168.1.2"
+    assert all(m["server_addr"] == "1.2.3.4" and m["source_file"] == "home" for m in mappings)
+
+
+def test_collect_frpc_admin_skips_failing_endpoints(frpc_admin_url):
+    endpoints = [
+        {"url": frpc_admin_url, "user": "admin", "pass": "wrong"},
+        {"url": "http://127.0.0.1:1"},
+        {"url": frpc_admin_url, "user": "admin", "pass": "pw"},
+    ]
+    assert set(_by_name(collect_frpc_admin(endpoints, timeout=2))) == {"ssh", "web", "dyn"}
+
+
+def test_collect_frpc_admin_without_endpoints():
+    assert collect_frpc_admin([]) == []
+
+
+def test_merge_mappings_prefers_admin_and_keeps_file_order():
+    file_mappings = [
+        {"name": "ssh", "local_ip": "127.0.0.1", "local_port": "22", "remote_port": "6000",
+         "server_addr": "1.2.3.4", "source_file": "frpc.toml"},
+        {"name": "other", "local_ip": "127.0.0.1", "local_port": "1", "remote_port": "2",
+         "server_addr": "9.9.9.9", "source_file": "x.ini"},
+        # 同名但 server_addr 不同，不是同一个代理
+        {"name": "dyn", "local_ip": "127.0.0.1", "local_port": "3", "remote_port": "4",
+         "server_addr": "5.5.5.5", "source_file": "y.ini"},
+    ]
+    admin_mappings = [
+        {"name": "ssh", "local_ip": "127.0.0.1", "local_port": "22", "remote_port": "6022",
+         "server_addr": "1.2.3.4", "source_file": "frpc-admin", "running": True},
+        {"name": "dyn", "local_ip": "10.0.0.1", "local_port": "3389", "remote_port": "13389",
+         "server_addr": "1.2.3.4", "source_file": "frpc-admin", "running": True},
+    ]
+    merged = merge_mappings(file_mappings, admin_mappings)
+
+    assert [(m["name"], m["server_addr"]) for m in merged] == [
+        ("ssh", "1.2.3.4"), ("other", "9.9.9.9"), ("dyn", "5.5.5.5"), ("dyn", "1.2.3.4")]
+    assert merged[0]["remote_port"] == "6022"
+    assert merged[0]["running"] is True
+    # 合并后保留配置文件的来源名
+    assert merged[0]["source_file"] == "frpc.toml"
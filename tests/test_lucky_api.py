@@ -0,0 +1,20 @@
+from lucky_api import rules_to_services
+
+
+def test_rules_to_services():
+    rules = [
+        {"EnableTLS": True, "ListenPort": 443, "ProxyList": [
+            {"Domains": ["A.com", " "], "Locations": ["http://127.0.0.1:5000"]},
+            {"Enable": False, "Domains": ["off.com"], "Locations": ["http://x"]},
+        ]},
+        # 非默认端口拼进域名；没有后端地址时用类型名代替
+        {"ListenPort": 8080, "ProxyList": [
+            {"Domains": ["b.com", "a.com"], "Locations": [], "WebServiceType": "redirect"},
+        ]},
+        {"Enable": False, "ProxyList": [{"Domains": ["c.com"], "Locations": ["http://z"]}]},
+    ]
+    assert rules_to_services(rules) == [
+        {"domain": "a.com", "protocol": "https", "internal_addr": "http://127.0.0.1:5000"},
+        {"domain": "b.com:8080", "protocol": "http", "internal_addr": "redirect"},
+        {"domain": "a.com:8080", "protocol": "http", "internal_addr": "redirect"},
+    ]
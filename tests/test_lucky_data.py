@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import lucky_data
+from lucky_data import LuckyScrapeError, get_lucky_services, parse_rule_texts
+
+
+def test_parse_rule_texts_separators_and_fallback():
+    texts = [
+        "nas.example.com ➔ http://192.168.1.2:5000\n备注",
+        "https://a.b.com:8443 -> 文件服务 | 其他",
+        "添加Web规则",
+        "",
+        # 没有分隔符时按正则一头一尾匹配
+        "foo.example.org http://127.0.0.1:9000",
+        # 同一域名只保留第一条
+        "nas.example.com ➔ http://dup",
+    ]
+    assert parse_rule_texts(texts) == [
+        {"domain": "nas.example.com", "protocol": "http", "internal_addr": "http://192.168.1.2:5000"},
+        {"domain": "a.b.com:8443", "protocol": "https", "internal_addr": "文件服务"},
+        {"domain": "foo.example.org", "protocol": "http", "internal_addr": "http://127.0.0.1:9000"},
+    ]
+
+
+class _FakeContext:
+    async def new_page(self):
+        return object()
+
+    async def storage_state(self):
+        return {"cookies": []}
+
+    async def close(self):
+        pass
+
+
+class _FakeBrowser:
+    async def new_context(self, **kwargs):
+        return _FakeContext()
+
+
+def _fake_scrape(auth_result, services):
+    async def scrape(page, url, username, password, server_name, wait_mode="event", auth=None):
+        auth.update(auth_result)
+        return services
+    return scrape
+
+
+def test_get_lucky_services_raises_when_login_fails(monkeypatch, tmp_path):
+    monkeypatch.setattr(lucky_data, "_scrape_page", _fake_scrape({"login_required": True}, []))
+    with pytest.raises(LuckyScrapeError):
+        asyncio.run(get_lucky_services("http://lucky", "u", "p", "home", _FakeBrowser(), state_dir=str(tmp_path)))
+
+
+def test_get_lucky_services_returns_empty_result_after_login(monkeypatch, tmp_path):
+    # 登录成功但节点上确实没有规则，空列表是合法结果
+    monkeypatch.setattr(lucky_data, "_scrape_page", _fake_scrape({"login_required": True, "login_ok": True}, []))
+    assert asyncio.run(get_lucky_services("http://lucky", "u", "p", "home", _FakeBrowser(), state_dir=str(tmp_path))) == []
+    assert (tmp_path / "home.json").exists()
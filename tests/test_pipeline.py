@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from pipeline import Pipeline
+
+SERVICES = {
+    "A": [{"domain": f"a{i}.example.com", "protocol": "http", "internal_addr": f"http://127.0.0.1:{5000 + i}",
+           "server_name": "A"} for i in range(20)],
+    "B": [{"domain": "b.example.com", "protocol": "http", "internal_addr": "http://10.0.0.2:80", "server_name": "B"}],
+}
+
+
+class _Fetcher:
+    """图标消费者：取到 fail_after 条记录后抛出异常 (模拟 fetch_queue 崩溃)；fail_after 为 None 时正常消费"""
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.seen = []
+
+    async def fetch_queue(self, queue):
+        while True:
+            s = await queue.get()
+            if s is None:
+                return self.seen
+            self.seen.append(s)
+            if self.fail_after is not None and len(self.seen) >= self.fail_after:
+                raise RuntimeError("icon worker crashed")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    config = {"lucky_servers": [{"name": n, "url": f"http://{n.lower()}.lan:16601"} for n in SERVICES],
+              "icon_queue_size": 2}
+    p = Pipeline(config, output_dir=str(tmp_path / "out"), cache_file=str(tmp_path / "cache.json"))
+    p.lucky_cache = {name: {"services": services} for name, services in SERVICES.items()}
+
+    async def refresh_lucky(refresh_names=(), prefer_cache=False, on_server=None):
+        for name in SERVICES:
+            on_server(name)
+            await asyncio.sleep(0)
+        return [s for services in SERVICES.values() for s in services]
+
+    monkeypatch.setattr(p, "refresh_lucky", refresh_lucky)
+    for stage in ("scan_frp", "sync_cf", "prefetch_hosts"):
+        monkeypatch.setattr(p, stage, lambda *a, **k: None)
+    monkeypatch.setattr(p, "resolve_hosts", lambda hosts: {})
+    return p
+
+
+def test_stream_feeds_every_record_to_the_icon_worker(pipeline, monkeypatch):
+    fetcher = _Fetcher()
+    monkeypatch.setattr(pipeline, "_new_fetcher", lambda: fetcher)
+    lucky_services, final_data = asyncio.run(asyncio.wait_for(pipeline.stream(), timeout=10))
+    assert len(final_data) == len(lucky_services) == 21
+    assert fetcher.seen == final_data
+
+
+def test_stream_fails_instead_of_hanging_when_icon_worker_dies(pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline, "_new_fetcher", lambda: _Fetcher(fail_after=1))
+    # 队列容量 2，消费者死掉后生产者必然被阻塞；应当抛出消费者的异常而不是超时
+    with pytest.raises(RuntimeError, match="icon worker crashed"):
+        asyncio.run(asyncio.wait_for(pipeline.stream(), timeout=10))
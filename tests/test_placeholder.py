@@ -0,0 +1,21 @@
+import pytest
+
+from placeholder import PALETTE, color_for, js_string_hash
+
+
+# 参考值由 node 按 template.html 的 getColorForComment 循环计算: hash = s.charCodeAt(i) + ((hash << 5) - hash)
+@pytest.mark.parametrize("text,expected", [
+    ("", 0),
+    ("abc", 96354),
+    ("nas.example.top", -3150338301),
+    ("a-very-long-subdomain.lab.example.com", 2622703916),
+    ("影音", 796322),
+    # 代理对按两个 UTF-16 码元计算
+    ("😀emoji.io", -897382863),
+])
+def test_js_string_hash_matches_template(text, expected):
+    assert js_string_hash(text) == expected
+
+
+def test_color_for_is_deterministic():
+    assert color_for("nas.example.top") == PALETTE[abs(-3150338301) % len(PALETTE)]
@@ -0,0 +1,141 @@
+import random
+
+import pytest
+
+from frp_index import FrpIndex
+from legacy import legacy_cf_lookup, legacy_resolve_all
+from resolver import ServiceResolver
+from cf_dns import build_cf_index
+
+
+def make_fleet(n_services=400, seed=7):
+    """合成数据：保证前置 / 后置 FRP、static_mappings、STUN、泛域名与主机名形式的 server_addr 都有命中"""
+    rnd = random.Random(seed)
+    server_ips = {"home": "192.168.1.2", "vps": "45.67.89.1", "edge": "10.0.0.8"}
+    zones = ["example.com", "lab.example.com", "demo.net"]
+
+    frp_mappings = []
+    for i in range(n_services):
+        frp_mappings.append({
+            "name": f"proxy-{i}",
+            "local_ip": rnd.choice(["127.0.0.1", "192.168.1.2", "192.168.1.50", "0.0.0.0"]),
+            "local_port": str(rnd.randint(2000, 2400)),
+            "remote_port": str(rnd.randint(2000, 2400)),
+            "server_addr": rnd.choice(["45.67.89.1", "127.0.0.1", "frps.example.com", "frps.demo.net", "frps.other.org", "10.0.0.8"]),
+            "source_file": f"frpc{i % 5}.toml",
+        })
+
+    services, cf_records = [], []
+    for i in range(n_services):
+        zone = rnd.choice(zones)
+        host = f"svc{i}.{zone}"
+        port = rnd.choice(["", "", ":2100", ":8443", f":{rnd.randint(2000, 2400)}"])
+        services.append({
+            "domain": host + port,
+            "protocol": rnd.choice(["http", "https"]),
+            "internal_addr": rnd.choice([
+                f"http://127.0.0.1:{rnd.randint(2000, 2400)}",
+                f"http://192.168.1.{rnd.randint(2, 60)}:{rnd.randint(2000, 2400)}",
+                "https://localhost:9000/path",
+                "文件服务",
+            ]),
+            "server_name": rnd.choice(list(server_ips)),
+        })
+        if rnd.random() < 0.5:
+            cf_records.append({"name": host, "content": rnd.choice(list(server_ips.values()) + ["1.1.1.1"]),
+                               "proxied": rnd.random() < 0.3, "type": "A"})
+    cf_records.append({"name": "frps.example.com", "content": "45.67.89.1", "proxied": False, "type": "A"})
+    cf_records.append({"name": "*.demo.net", "content": "45.67.89.1", "proxied": False, "type": "A"})
+    # STUN 目标
+    services.append({"domain": "target.lab.example.com", "protocol": "http",
+                     "internal_addr": "http://10.9.9.9:99", "server_name": "edge"})
+
+    static_mappings = [
+        {"pattern": r"stun\d*\.example\.com", "description": "{stun_server_name} {stun_internal_addr}",
+         "stun_route": {r"^stun\d*\.example\.com$": "target.lab.example.com"}},
+        {"pattern": r"svc1\d\.lab\.example\.com", "description": "{server_name} ➔ {internal_addr} :{port}",
+         "comment": "lab", "port_map": {"8443": "18443"}, "TLS": True},
+        {"pattern": r".*\.demo\.net", "description": "{ip} ➔ {server_name}", "undisplay": True},
+    ]
+    services.extend({"domain": f"stun{i}.example.com", "protocol": "http",
+                     "internal_addr": "http://127.0.0.1:1", "server_name": "home"} for i in range(3))
+
+    host_ips = {f"svc{i}.{z}": rnd.choice(["45.67.89.1", "10.0.0.8", None]) for i in range(n_services) for z in zones}
+    host_ips["frps.other.org"] = "10.0.0.8"
+    ip_aliases = {"45.67.89.1": "香港中转", "1.1.1.1": "Cloudflare"}
+    return services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases
+
+
+def test_service_resolver_matches_legacy_loop():
+    services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases = make_fleet()
+    expected = legacy_resolve_all(services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases)
+    resolver = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings, cf_records=cf_records,
+                               host_ips=host_ips, ip_aliases=ip_aliases, verbose=False)
+
+    assert resolver.resolve_all(services) == expected
+    # 合成数据确实覆盖了各条路径
+    assert any(r['frp_info'] != "无" for r in expected)
+    assert any("FRP 入站" in r['chain'] for r in expected)
+    assert any("target.lab.example.com" in r['chain'] for r in expected)
+
+
+def test_service_resolver_accepts_prebuilt_indexes():
+    services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases = make_fleet(100)
+    fresh = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings, cf_records=cf_records,
+                            host_ips=host_ips, ip_aliases=ip_aliases, verbose=False)
+    reused = ServiceResolver(fresh.frp_index, server_ips, static_mappings=fresh.static_matcher,
+                             cf_index=build_cf_index(cf_records), host_ips=host_ips, ip_aliases=ip_aliases, verbose=False)
+    assert reused.resolve_all(services) == fresh.resolve_all(services)
+
+
+def test_reset_reuses_indexes_with_new_dns_results():
+    services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases = make_fleet(100)
+    resolver = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings, cf_records=cf_records,
+                               host_ips={}, ip_aliases=ip_aliases, verbose=False)
+    resolver.resolve_all(services)
+    resolver.reset(host_ips, server_ips)
+    expected = legacy_resolve_all(services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases)
+    # frps.other.org 不在 CF 记录中，只能靠 DNS 解析，换了 DNS 结果后 FRP 索引必须重建
+    assert resolver.frp_index_stale()
+    rebuilt = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings, cf_records=cf_records,
+                              host_ips=host_ips, ip_aliases=ip_aliases, verbose=False)
+    assert not rebuilt.frp_index_stale()
+    assert rebuilt.resolve_all(services) == expected
+
+
+def test_needs_full_index_only_for_stun_routes():
+    services, frp_mappings, server_ips, static_mappings, cf_records, host_ips, ip_aliases = make_fleet(50)
+    resolver = ServiceResolver(frp_mappings, server_ips, static_mappings=static_mappings, verbose=False)
+    assert resolver.needs_full_index({"domain": "stun1.example.com:8080"})
+    assert not resolver.needs_full_index({"domain": "svc12.lab.example.com"})
+
+
+def test_frp_ports():
+    assert ServiceResolver.frp_ports({"domain": "a.com", "protocol": "https", "internal_addr": "http://127.0.0.1:5000/x"}) == {"443", "5000"}
+    assert ServiceResolver.frp_ports({"domain": "a.com:8080", "internal_addr": "文件服务"}) == {"8080"}
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_frp_index_matches_linear_scan(seed):
+    services, frp_mappings, server_ips, *_ , cf_records, host_ips, _ = make_fleet(300, seed)
+
+    def resolve_server(addr):
+        rec = legacy_cf_lookup(cf_records, addr)
+        return rec['content'] if rec else (host_ips.get(addr) or "Unknown")
+
+    index = FrpIndex(frp_mappings, resolve_server)
+    rnd = random.Random(seed)
+    for _ in range(500):
+        ip = rnd.choice(list(server_ips.values()) + ["127.0.0.1", "Unknown"])
+        port = str(rnd.randint(2000, 2400))
+        lucky_ip = rnd.choice(list(server_ips.values()) + [None])
+
+        expected_pre = next((fm for fm in frp_mappings
+                             if (fm['server_addr'] if fm['server_addr'][0].isdigit() else resolve_server(fm['server_addr'])) == ip.lower()
+                             and port in (fm['remote_port'], fm['local_port'])
+                             and fm['local_ip'] in ('127.0.0.1', 'localhost', '0.0.0.0', (lucky_ip or "").lower())), None)
+        expected_post = next((fm for fm in frp_mappings
+                              if port in (fm['remote_port'], fm['local_port'])
+                              and ((lucky_ip and fm['server_addr'] == lucky_ip) or fm['server_addr'] in ('127.0.0.1', 'localhost', '0.0.0.0'))), None)
+        assert index.match_pre_lucky(ip, port, lucky_ip) is expected_pre
+        assert index.match_post_lucky(port, lucky_ip) is expected_post
@@ -0,0 +1,34 @@
+import pytest
+
+from scanner_frp import expand_ports, parse_frp_configs, parse_frp_text
+
+
+def test_expand_ports():
+    assert expand_ports("6000-6002, 6010,") == ["6000", "6001", "6002", "6010"]
+    assert expand_ports(22) == ["22"]
+    with pytest.raises(ValueError):
+        expand_ports("80-abc")
+
+
+def test_range_mappings_from_ini():
+    content = "[common]\nserver_addr = 1.2.3.4\n[range:game]\nlocal_port = 6000-6001\nremote_port = 7000-7001\n"
+    mappings = parse_frp_text(content, "frpc.ini", "frpc.ini")
+    assert [(m['name'], m['local_port'], m['remote_port']) for m in mappings] == [
+        ("game_0", "6000", "7000"), ("game_1", "6001", "7001")]
+
+
+def test_bad_port_skips_only_that_proxy(tmp_path, capsys):
+    bad = tmp_path / "frpc.toml"
+    bad.write_text('serverAddr = "1.2.3.4"\n'
+                   '[[proxies]]\nname = "ok"\nlocalPort = 22\nremotePort = 6022\n'
+                   '[[proxies]]\nname = "bad"\nlocalPort = "80-x"\nremotePort = "8080-8081"\n'
+                   '[[proxies]]\nname = "mismatch"\nlocalPort = "1-3"\nremotePort = "1-2"\n'
+                   '[[proxies]]\nname = "ok2"\nlocalPort = 80\nremotePort = 8080\n', encoding="utf-8")
+    good = tmp_path / "other.ini"
+    good.write_text("[common]\nserver_addr = 5.6.7.8\n[web]\nlocal_port = 81\nremote_port = 8181\n", encoding="utf-8")
+
+    mappings = parse_frp_configs([str(bad), str(good)])
+    assert [(m['name'], m['source_file']) for m in mappings] == [
+        ("ok", "frpc.toml"), ("ok2", "frpc.toml"), ("web", "other.ini")]
+    out = capsys.readouterr().out
+    assert "frpc.toml(bad)" in out and "frpc.toml(mismatch)" in out
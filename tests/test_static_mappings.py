@@ -0,0 +1,40 @@
+import re
+
+import pytest
+
+from static_mappings import StaticMappingMatcher
+
+DOMAINS = ["nas.example.com", "nas2.example.com", "stun1.example.com", "a.lab.example.com",
+           "ab.com", "b.com", "c.com", "x.org", "aa.example.com", "abab.net", "x.demo.net", "demo.net", "other.org", ""]
+
+
+def first_match(static_mappings, domain):
+    """重构前的逐条 re.match"""
+    return next((sm for sm in static_mappings if re.match(sm['pattern'], domain)), None)
+
+
+@pytest.mark.parametrize("patterns", [
+    [r"nas\d*\.example\.com", r"stun\d*\.example\.com", r".*\.lab\.example\.com", r".*\.demo\.net"],
+    # 前面的宽泛规则优先
+    [r".*\.example\.com", r"nas\.example\.com", r"(a|b)+\.net"],
+    # 反向引用无法合并，退回逐条匹配
+    [r"(\w)\1\.example\.com", r"(ab)\1\.net", r".*"],
+    [r"(?P<host>\w+)\.(?P=host)\.com", r"demo\.net"],
+    # 条件分组引用的编号在合并后会偏移，同样退回逐条匹配
+    [r"x\.org", r"(a)?(?(1)b|c)\.com"],
+])
+def test_matches_sequential_re_match(patterns):
+    static_mappings = [{"pattern": p, "description": str(i)} for i, p in enumerate(patterns)]
+    matcher = StaticMappingMatcher(static_mappings)
+    for domain in DOMAINS:
+        assert matcher.match(domain) is first_match(static_mappings, domain), domain
+
+
+def test_invalid_patterns_are_skipped():
+    static_mappings = [{"pattern": "(", "description": "bad"}, {"pattern": r"ok\.com", "description": "ok",
+                       "stun_route": {"[": "x", r"^ok\.com$": "target.com"}}]
+    matcher = StaticMappingMatcher(static_mappings)
+    assert len(matcher) == 1
+    sm = matcher.match("ok.com")
+    assert sm is static_mappings[1]
+    assert [(p.pattern, r) for p, r in matcher.stun_routes(sm)] == [(r"^ok\.com$", "target.com")]
@@ -1,17 +1,15 @@
-import socket
 import requests
 from urllib.parse import urlparse
 
+from dns_resolver import get_resolver
+
 # Cloudflare Configuration (Optional)
 CF_API_TOKEN = "" # Fill this if you want to use CF API
 
 def resolve_domain(domain):
-    try:
-        # Standard DNS resolution
-        ip = socket.gethostbyname(domain)
-        return ip
-    except:
-        return "Unknown"
+    # Standard DNS resolution, memoised (with negative caching) by the shared resolver
+    ip = get_resolver().resolve(domain)
+    return ip if ip else "Unknown"
 
 def get_favicon_url(domain):
     # Probing every domain sequentially with 3s timeouts is too slow for many domains.
@@ -0,0 +1,196 @@
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import struct
+import sys
+
+# inotify 常量 (linux/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+# 编辑器常见的“写临时文件再改名”保存方式触发的是 MOVED_TO，因此监听目录而不是文件本身
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_ATTRIB
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class _Targets:
+    """监听目标：具体文件 + 目录下按通配符匹配的文件 (用于发现新增的 frpc unit)"""
+    def __init__(self, files=(), patterns=None):
+        self.files = {os.path.abspath(p) for p in files if p}
+        self.patterns = {os.path.abspath(d): tuple(p) for d, p in (patterns or {}).items()}
+
+    def __eq__(self, other):
+        return isinstance(other, _Targets) and (self.files, self.patterns) == (other.files, other.patterns)
+
+    def dirs(self):
+        return {os.path.dirname(p) for p in self.files} | set(self.patterns)
+
+    def matches(self, path):
+        if path in self.files:
+            return True
+        globs = self.patterns.get(os.path.dirname(path))
+        return bool(globs) and any(fnmatch.fnmatch(os.path.basename(path), g) for g in globs)
+
+    def snapshot(self):
+        """轮询模式用：{路径: (mtime_ns, size)}，不存在的文件记为 None"""
+        state = {}
+        for path in self.files:
+            try:
+                st = os.stat(path)
+                state[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                state[path] = None
+        for directory in self.patterns:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if path not in state and self.matches(path):
+                    try:
+                        st = os.stat(path)
+                        state[path] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        pass
+        return state
+
+
+class FileWatcher:
+    """
+    文件变化监听器
+    - Linux 上通过 ctypes 调用 inotify (监听所在目录，覆盖原地写入与改名保存)，fd 挂在事件循环上
+    - 其他平台或 inotify 不可用时退回到按 poll_interval 秒轮询 mtime / size
+    - 连续的变化在 debounce 秒内合并为一批
+    用法: watcher.watch(files, patterns)；changed = await watcher.wait()
+    """
+    def __init__(self, debounce=0.5, poll_interval=2.0, backend="auto"):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.targets = _Targets()
+        self._changed = set()
+        self._event = None
+        self._fd = None
+        self._wds = {}
+        self._snapshot = {}
+        self._libc = _load_libc() if backend != "poll" else None
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+            else:
+                print(f"[!] [watch] inotify 初始化失败 ({os.strerror(ctypes.get_errno())})，改用轮询")
+        self.backend = "inotify" if self._fd is not None else "poll"
+
+    def watch(self, files=(), patterns=None):
+        """设置监听目标 (可重复调用以更新，目标不变时什么也不做)。patterns: {目录: [通配符, ...]}"""
+        targets = _Targets(files, patterns)
+        if targets == self.targets and (self._fd is not None or self._snapshot):
+            return
+        self.targets = targets
+        if self._fd is None:
+            # 已在监听的文件保留旧状态，避免丢失两次 watch() 之间发生的变化
+            self._snapshot = {p: self._snapshot.get(p, v) for p, v in targets.snapshot().items()}
+            return
+        wanted = self.targets.dirs()
+        for wd, directory in list(self._wds.items()):
+            if directory not in wanted:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._wds[wd]
+        current = set(self._wds.values())
+        for directory in wanted - current:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err != errno.ENOENT:
+                    print(f"[!] [watch] 无法监听 {directory}: {os.strerror(err)}")
+                continue
+            self._wds[wd] = directory
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出：无法确定哪些文件变了，按全部变化处理
+                self._changed.update(self.targets.files)
+                continue
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                continue
+            directory = self._wds.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if self.targets.matches(path):
+                self._changed.add(path)
+        if self._changed and self._event is not None:
+            self._event.set()
+
+    def _poll(self):
+        snapshot = self.targets.snapshot()
+        for path in set(snapshot) | set(self._snapshot):
+            if snapshot.get(path) != self._snapshot.get(path):
+                self._changed.add(path)
+        self._snapshot = snapshot
+
+    async def wait(self):
+        """等待下一批变化，返回变化的文件路径集合"""
+        loop = asyncio.get_running_loop()
+        if self._fd is not None:
+            if self._event is None:
+                self._event = asyncio.Event()
+                loop.add_reader(self._fd, self._on_readable)
+            while not self._changed:
+                self._event.clear()
+                await self._event.wait()
+            # 合并紧随其后的事件 (编辑器保存往往会触发多个事件)
+            await asyncio.sleep(self.debounce)
+        else:
+            while not self._changed:
+                await asyncio.sleep(self.poll_interval)
+                self._poll()
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                asyncio.get_event_loop().remove_reader(self._fd)
+            except Exception:
+                pass
+            os.close(self._fd)
+            self._fd = None